@@ -1,3 +1,5 @@
+import os
+import threading
 from datetime import datetime
 
 import pandas as pd
@@ -5,7 +7,8 @@ import requests
 import datetime
 from requests import HTTPError
 
-API = 'https://api.pro.coinbase.com/products'
+# COINBASE_REST can point the candles at another Coinbase compatible server, e.g. exchange_simulator.py
+API = os.environ.get('COINBASE_REST', 'https://api.pro.coinbase.com') + '/products'
 
 '''
 Inspiration for this class comes from 
@@ -34,26 +37,37 @@ def connect(url, params):
         print(f'Other error: {err}')
 
 
+class CandleFetchError(Exception):
+    pass
+
+
 class CandleWorker:
-    def __init__(self, name):
+    def __init__(self, name, api=None):
         self.name = name
-        self.time_since_last = 0
-        self.df = pd.DataFrame(data=default_time)
-        self.current_gran = 0
+        self.api = api or API
+
+        # Candles and the time they were fetched, kept per granularity so the dashboard and the
+        # export API asking for different granularities don't refetch each other's
+        self.frames = {}
+        self.fetch_times = {}
+        self.lock = threading.Lock()
+
+    def get_fetch_time(self, gran):
+        return self.fetch_times.get(gran, 0)
+
+    # Candles are refetched once they're older than the granularity
+    def is_stale(self, gran):
+        return datetime.datetime.today().timestamp() - self.get_fetch_time(gran) >= gran
 
     def get_data(self, gran):
+        if not self.is_stale(gran):
+            return self.frames[gran]
 
-        if self.time_since_last != 0:
-            if gran != self.current_gran:
-                return self.build_df(gran)
-            if datetime.datetime.today().timestamp() - self.time_since_last < gran:
-                return self.df
-            else:
+        # Only one thread fetches, the others wait for it and use its candles
+        with self.lock:
+            if self.is_stale(gran):
                 return self.build_df(gran)
-
-        else:
-            self.current_gran = 0
-            return self.build_df(gran)
+            return self.frames[gran]
 
     def build_df(self, gran):
 
@@ -61,7 +75,9 @@ class CandleWorker:
         end_date = datetime.datetime.today().isoformat()
 
         params = {'start': start_date, 'end': end_date, 'granularity': gran}
-        response = connect(API + '/' + self.name + '/candles', params)
+        response = connect(self.api + '/' + self.name + '/candles', params)
+        if response is None or response.status_code != 200:
+            raise CandleFetchError('Could not fetch ' + str(gran) + 's candles for ' + self.name)
         response_text = response.text
 
         df = pd.read_json(response_text)
@@ -70,7 +86,7 @@ class CandleWorker:
         df['date'] = pd.to_datetime(df['time'], unit='s')
         del df['time']
 
-        self.time_since_last = datetime.datetime.today().timestamp()
-        self.df = df
+        self.frames[gran] = df
+        self.fetch_times[gran] = datetime.datetime.today().timestamp()
 
         return df
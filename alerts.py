@@ -0,0 +1,212 @@
+import bisect
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+# Alert conditions, every alert fires once and is then removed
+ABOVE = 'above'  # Fires when the value is above the threshold
+BELOW = 'below'  # Fires when the value is below the threshold
+CROSS = 'cross'  # Fires when the value moves across the threshold either way
+
+
+class Alert:
+    def __init__(self, alert_id, symbol, metric, condition, threshold):
+        self.alert_id = alert_id
+        self.symbol = symbol
+        self.metric = metric
+        self.condition = condition
+        self.threshold = threshold
+
+    def describe(self):
+        return self.symbol.upper() + ' ' + self.metric + ' ' + self.condition + ' ' + str(self.threshold)
+
+    # Whether the condition is met by a value on its own, a cross needs a move to be met
+    def holds(self, value):
+        if self.condition == ABOVE:
+            return value > self.threshold
+        if self.condition == BELOW:
+            return value < self.threshold
+        return False
+
+
+class ThresholdIndex:
+    """
+    Thresholds for one symbol/metric pair kept in sorted lists.
+
+    Thresholds which fire on a rising value and on a falling value are kept apart, so a move from
+    old to new only has to bisect for the slice of thresholds which lie between the two values.
+    """
+
+    def __init__(self):
+        self.rising_keys = []
+        self.rising = []
+        self.falling_keys = []
+        self.falling = []
+        self.last_value = None
+
+    def __len__(self):
+        return len(self.rising) + len(self.falling)
+
+    @staticmethod
+    def _insert(keys, alerts, alert):
+        position = bisect.bisect_right(keys, alert.threshold)
+        keys.insert(position, alert.threshold)
+        alerts.insert(position, alert)
+
+    @staticmethod
+    def _remove(keys, alerts, alert):
+        position = bisect.bisect_left(keys, alert.threshold)
+        while position < len(keys) and keys[position] == alert.threshold:
+            if alerts[position] is alert:
+                del keys[position]
+                del alerts[position]
+                return
+            position += 1
+
+    def add(self, alert):
+        if alert.condition in (ABOVE, CROSS):
+            self._insert(self.rising_keys, self.rising, alert)
+        if alert.condition in (BELOW, CROSS):
+            self._insert(self.falling_keys, self.falling, alert)
+
+    def remove(self, alert):
+        if alert.condition in (ABOVE, CROSS):
+            self._remove(self.rising_keys, self.rising, alert)
+        if alert.condition in (BELOW, CROSS):
+            self._remove(self.falling_keys, self.falling, alert)
+
+    # Stores the new value and returns the alerts whose threshold was crossed getting there
+    # With no earlier value, returns the above and below alerts the first value already meets
+    def update(self, value):
+        old = self.last_value
+        self.last_value = value
+        if old is None:
+            below = self.rising[:bisect.bisect_left(self.rising_keys, value)]  # threshold < value
+            above = self.falling[bisect.bisect_right(self.falling_keys, value):]  # value < threshold
+            return [alert for alert in below + above if alert.holds(value)]
+        if value == old:
+            return []
+        if value > old:  # old <= threshold < value
+            return self.rising[bisect.bisect_left(self.rising_keys, old):bisect.bisect_left(self.rising_keys, value)]
+        # value < threshold <= old
+        return self.falling[bisect.bisect_right(self.falling_keys, value):bisect.bisect_right(self.falling_keys, old)]
+
+
+class AlertEngine:
+    """
+    Price and metric alerts for every book in the MasterObject.
+
+    Books call `observe` from the feed thread after each update. Alerts fire once, when their
+    condition is met, and are then removed, so a value moving back and forth across a threshold
+    doesn't repeat the alert. Triggered alerts are put on a bounded queue so the feed is never
+    blocked by the dashboard, the oldest alert is dropped when the queue is full.
+    """
+
+    def __init__(self, max_queue=1000, max_recent=20):
+        self.alerts = {}
+        self.indexes = {}  # symbol -> {metric: ThresholdIndex}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+        self.triggered = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.recent = deque(maxlen=max_recent)
+
+    def add_alert(self, symbol, metric, condition, threshold):
+        if condition not in (ABOVE, BELOW, CROSS):
+            raise ValueError('Unknown alert condition: ' + str(condition))
+
+        with self.lock:
+            alert = Alert(next(self.ids), symbol, metric, condition, float(threshold))
+            index = self.indexes.setdefault(symbol, {}).setdefault(metric, ThresholdIndex())
+            value = index.last_value
+            if value is None or not alert.holds(value):
+                index.add(alert)
+                self.alerts[alert.alert_id] = alert
+
+        # Already met, e.g. spread above 5 added while the spread is 7
+        if value is not None and alert.holds(value):
+            self.publish(alert, value, time.time())
+        return alert
+
+    def remove_alert(self, alert_id):
+        with self.lock:
+            return self._remove(alert_id)
+
+    # Must be called with the lock held
+    def _remove(self, alert_id):
+        alert = self.alerts.pop(alert_id, None)
+        if alert is not None:
+            self.indexes[alert.symbol][alert.metric].remove(alert)
+        return alert
+
+    # Alerts which haven't fired yet, in the order they were added
+    def get_alerts(self):
+        return sorted(self.alerts.values(), key=lambda alert: alert.alert_id)
+
+    def get_num_alerts(self):
+        return len(self.alerts)
+
+    def has_alerts(self, symbol):
+        return symbol in self.indexes
+
+    # Checks a single metric move, returns the number of alerts fired
+    def observe(self, symbol, metric, value, timestamp):
+        metrics = self.indexes.get(symbol)
+        if metrics is None or metric not in metrics:
+            return 0
+        with self.lock:
+            hits = metrics[metric].update(value)
+            for alert in hits:
+                self._remove(alert.alert_id)
+        for alert in hits:
+            self.publish(alert, value, timestamp)
+        return len(hits)
+
+    # Checks every metric with alerts for the symbol, metrics being a dict of metric -> value
+    def observe_metrics(self, symbol, metrics, timestamp):
+        indexes = self.indexes.get(symbol)
+        if indexes is None:
+            return 0
+        fired = []
+        with self.lock:
+            for metric, index in indexes.items():
+                value = metrics.get(metric)
+                if value is not None:
+                    fired.extend((alert, value) for alert in index.update(value))
+            for alert, value in fired:
+                self._remove(alert.alert_id)
+        for alert, value in fired:
+            self.publish(alert, value, timestamp)
+        return len(fired)
+
+    def publish(self, alert, value, timestamp):
+        event = {'id': alert.alert_id,
+                 'symbol': alert.symbol,
+                 'metric': alert.metric,
+                 'condition': alert.condition,
+                 'threshold': alert.threshold,
+                 'value': value,
+                 'timestamp': timestamp,
+                 'message': alert.describe() + ' (now ' + '{:.4f}'.format(value) + ')'}
+        while True:
+            try:
+                self.triggered.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.triggered.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # Moves waiting alerts into the recent list shown on the dashboard
+    def get_recent(self):
+        while True:
+            try:
+                self.recent.appendleft(self.triggered.get_nowait())
+            except queue.Empty:
+                break
+        return list(self.recent)
@@ -0,0 +1,103 @@
+import bisect
+import sys
+from array import array
+
+from book_analytics import BID, ASK
+
+
+class ArrayBookSide:
+    """
+    One side of an L2 book as two parallel float64 arrays (prices and sizes) sorted by price.
+
+    This replaces the deepcopied cryptofeed SortedDict - it is much smaller (16 bytes per level) and
+    has the parts of the SortedDict interface the rest of the app uses: get, in, item access,
+    bisect_left/bisect_right, peekitem and items.
+    """
+
+    __slots__ = ('prices', 'sizes')
+
+    def __init__(self, levels=()):
+        self.prices = array('d')
+        self.sizes = array('d')
+        for price, size in sorted((float(price), float(size)) for price, size in levels):
+            self.prices.append(price)
+            self.sizes.append(size)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __contains__(self, price):
+        price = float(price)
+        index = bisect.bisect_left(self.prices, price)
+        return index < len(self.prices) and self.prices[index] == price
+
+    def __iter__(self):
+        return iter(self.prices.tolist())
+
+    def __getitem__(self, price):
+        price = float(price)
+        index = bisect.bisect_left(self.prices, price)
+        if index == len(self.prices) or self.prices[index] != price:
+            raise KeyError(price)
+        return self.sizes[index]
+
+    def __setitem__(self, price, size):
+        price = float(price)
+        index = bisect.bisect_left(self.prices, price)
+        if index < len(self.prices) and self.prices[index] == price:
+            self.sizes[index] = float(size)
+        else:
+            self.prices.insert(index, price)
+            self.sizes.insert(index, float(size))
+
+    def __delitem__(self, price):
+        price = float(price)
+        index = bisect.bisect_left(self.prices, price)
+        if index == len(self.prices) or self.prices[index] != price:
+            raise KeyError(price)
+        del self.prices[index]
+        del self.sizes[index]
+
+    def get(self, price, default=None):
+        try:
+            return self[price]
+        except KeyError:
+            return default
+
+    def bisect_left(self, price):
+        return bisect.bisect_left(self.prices, float(price))
+
+    def bisect_right(self, price):
+        return bisect.bisect_right(self.prices, float(price))
+
+    def peekitem(self, index=-1):
+        return self.prices[index], self.sizes[index]
+
+    # (price, size) pairs from the lowest price up
+    def items(self):
+        return list(zip(self.prices.tolist(), self.sizes.tolist()))
+
+    # Keeps the max_levels closest to the top of the book, returns the removed (price, size) levels
+    # Slicing copies into right sized arrays so the memory of the removed levels is given back
+    def truncate(self, side, max_levels):
+        extra = len(self.prices) - max_levels
+        if extra <= 0:
+            return []
+        if side == BID:  # Lowest bids are furthest from the top
+            removed = list(zip(self.prices[:extra].tolist(), self.sizes[:extra].tolist()))
+            self.prices = self.prices[extra:]
+            self.sizes = self.sizes[extra:]
+        else:
+            removed = list(zip(self.prices[max_levels:].tolist(), self.sizes[max_levels:].tolist()))
+            self.prices = self.prices[:max_levels]
+            self.sizes = self.sizes[:max_levels]
+        return removed
+
+    def nbytes(self):
+        return sys.getsizeof(self.prices) + sys.getsizeof(self.sizes)
+
+
+# Builds the canonical book for an OrderBook from a cryptofeed book
+def from_cryptofeed(book):
+    return {BID: ArrayBookSide(book[BID].items()),
+            ASK: ArrayBookSide(book[ASK].items())}
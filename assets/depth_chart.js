@@ -0,0 +1,112 @@
+// Clientside rendering of the depth and wall charts
+// The server only sends the packed book arrays (see OrderBook.get_payload), the figure is built here
+
+var BID_COLOUR = 'rgb(34, 139, 34)';
+var ASK_COLOUR = 'rgb(255, 160, 122)';
+
+// Base64 string of little-endian float64s -> Float64Array
+function unpackFloats(encoded) {
+    var binary = atob(encoded);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new Float64Array(bytes.buffer);
+}
+
+// Running total from the lowest price up
+function cumulative(sizes) {
+    var result = new Float64Array(sizes.length);
+    var total = 0;
+    for (var i = 0; i < sizes.length; i++) {
+        total += sizes[i];
+        result[i] = total;
+    }
+    return result;
+}
+
+// Running total from the highest price down
+function reverseCumulative(sizes) {
+    var result = new Float64Array(sizes.length);
+    var total = 0;
+    for (var i = sizes.length - 1; i >= 0; i--) {
+        total += sizes[i];
+        result[i] = total;
+    }
+    return result;
+}
+
+function buildLayout(payload) {
+    return {
+        plot_bgcolor: '#262626',
+        paper_bgcolor: '#262626',
+        font: {color: 'white'},
+        xaxis: {title: {text: payload.symbol_string}},
+        yaxis: {title: {text: payload.size}},
+        legend: {title: {text: 'Side'}},
+        shapes: [{
+            type: 'line',
+            x0: payload.mid,
+            x1: payload.mid,
+            xref: 'x',
+            y0: 0,
+            y1: 1,
+            yref: 'paper'
+        }],
+        annotations: [{
+            x: payload.mid,
+            xref: 'x',
+            y: 1,
+            yref: 'paper',
+            yanchor: 'bottom',
+            showarrow: false,
+            text: 'Mid-Market Price: ' + payload.mid.toFixed(2)
+        }],
+        images: [{
+            source: payload.logo,
+            xref: 'paper',
+            yref: 'paper',
+            x: 0.25,
+            y: 1,
+            sizex: 1,
+            sizey: 1,
+            layer: 'below',
+            sizing: 'contain',
+            opacity: 0.075
+        }]
+    };
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    depth: {
+        render: function (payload, chart) {
+            if (!payload) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+
+            var bidPrices = unpackFloats(payload.bid_prices);
+            var bidSizes = unpackFloats(payload.bid_sizes);
+            var askPrices = unpackFloats(payload.ask_prices);
+            var askSizes = unpackFloats(payload.ask_sizes);
+            var data;
+
+            if (chart === 'wall') {
+                data = [
+                    {x: askPrices, y: askSizes, name: 'ask', type: 'scatter', mode: 'lines',
+                        line: {color: ASK_COLOUR}},
+                    {x: bidPrices, y: bidSizes, name: 'bid', type: 'scatter', mode: 'lines',
+                        line: {color: BID_COLOUR}}
+                ];
+            } else {
+                data = [
+                    {x: askPrices, y: cumulative(askSizes), name: 'ask', type: 'scatter', mode: 'lines',
+                        line: {color: ASK_COLOUR, width: 5, shape: 'hv'}},
+                    {x: bidPrices, y: reverseCumulative(bidSizes), name: 'bid', type: 'scatter', mode: 'lines',
+                        line: {color: BID_COLOUR, width: 5, shape: 'vh'}}
+                ];
+            }
+
+            return [{data: data, layout: buildLayout(payload)}, payload.key];
+        }
+    }
+});
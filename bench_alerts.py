@@ -0,0 +1,79 @@
+import random
+import time
+
+from alerts import AlertEngine, ABOVE, BELOW, CROSS
+
+# Benchmark for the alert engine - registers NUM_ALERTS alerts over a set of symbols and metrics,
+# then random walks the metric values and compares the indexed engine against a linear scan.
+# Alerts are removed when they fire, so each fired alert is replaced to keep NUM_ALERTS registered.
+
+NUM_ALERTS = 10000
+NUM_UPDATES = 200000
+SYMBOLS = ['btc', 'eth', 'ada', 'matic', 'bat', 'dot', 'algo', 'uni', 'sol', 'chz', 'mana', 'etc', 'xtz']
+METRICS = {'mid': (100.0, 1.0), 'spread_bps': (5.0, 0.5), 'imbalance': (0.0, 0.05)}
+
+
+def linear_scan(alerts, last_values, symbol, metric, value):
+    old = last_values.get((symbol, metric))
+    last_values[(symbol, metric)] = value
+    hits = 0
+    if old is None:
+        return hits
+    for alert in alerts:
+        if alert.symbol != symbol or alert.metric != metric:
+            continue
+        rising = old <= alert.threshold < value
+        falling = value < alert.threshold <= old
+        if (rising and alert.condition in (ABOVE, CROSS)) or (falling and alert.condition in (BELOW, CROSS)):
+            hits += 1
+    return hits
+
+
+def random_alert():
+    metric = random.choice(list(METRICS))
+    centre, step = METRICS[metric]
+    return random.choice(SYMBOLS), metric, random.choice((ABOVE, BELOW, CROSS)), random.gauss(centre, step * 20)
+
+
+def main():
+    random.seed(42)
+    engine = AlertEngine(max_queue=1000)
+    for _ in range(NUM_ALERTS):
+        engine.add_alert(*random_alert())
+
+    values = {(symbol, metric): METRICS[metric][0] for symbol in SYMBOLS for metric in METRICS}
+    moves = []
+    for _ in range(NUM_UPDATES):
+        key = random.choice(list(values))
+        values[key] += random.gauss(0, METRICS[key[1]][1])
+        moves.append((key[0], key[1], values[key]))
+
+    replacements = [random_alert() for _ in range(NUM_UPDATES)]
+
+    start = time.perf_counter()
+    indexed_hits = 0
+    replaced = 0
+    for symbol, metric, value in moves:
+        indexed_hits += engine.observe(symbol, metric, value, 0)
+        # Replacements which are already met fire straight away and aren't registered
+        while engine.get_num_alerts() < NUM_ALERTS:
+            engine.add_alert(*replacements[replaced % len(replacements)])
+            replaced += 1
+    indexed = time.perf_counter() - start
+
+    alerts = list(engine.alerts.values())
+    last_values = {}
+    linear_moves = moves[:NUM_UPDATES // 100]
+    start = time.perf_counter()
+    for symbol, metric, value in linear_moves:
+        linear_scan(alerts, last_values, symbol, metric, value)
+    linear = time.perf_counter() - start
+
+    print('Registered alerts: ' + str(engine.get_num_alerts()))
+    print('Indexed: {:.2f} us per update, {} alerts fired, {} dropped from the queue'.format(
+        indexed / len(moves) * 1e6, indexed_hits, engine.dropped))
+    print('Linear scan: {:.2f} us per update'.format(linear / len(linear_moves) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
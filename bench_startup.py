@@ -0,0 +1,35 @@
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Measures the time from launching webserver.py until the first page is served
+# Usage: python bench_startup.py [runs]
+
+URL = 'http://127.0.0.1:8050/'
+TIMEOUT = 60
+
+
+def time_to_first_page():
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, 'webserver.py'], stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < TIMEOUT:
+            try:
+                with urllib.request.urlopen(URL, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError('Web server did not respond within ' + str(TIMEOUT) + 's')
+    finally:
+        server.kill()
+        server.wait()
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    results = [time_to_first_page() for _ in range(runs)]
+    print('Time to first page: ' + ', '.join('{:.2f}s'.format(result) for result in results) +
+          ' (best {:.2f}s)'.format(min(results)))
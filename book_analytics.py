@@ -0,0 +1,337 @@
+import math
+import sys
+from array import array
+
+# Same values as cryptofeed.defines, kept here so importing doesn't pull in all of cryptofeed
+BID = 'bid'
+ASK = 'ask'
+
+# Rolling windows (in seconds) used for trade-flow imbalance and realized volatility
+DEFAULT_WINDOWS = (60, 300)
+
+
+# Names of the values returned by BookAnalytics.get_metrics
+def metric_names(windows=DEFAULT_WINDOWS):
+    names = ['mid', 'spread', 'spread_bps', 'weighted_mid', 'imbalance', 'pressure', 'bid_depth', 'ask_depth']
+    for window in windows:
+        names.append('trade_flow_' + str(window) + 's')
+        names.append('volatility_' + str(window) + 's')
+    return names
+
+
+class RollingWindow:
+    """
+    Time based rolling sum over `seconds`, kept in a fixed number of time buckets.
+
+    Samples are added to the bucket for their time and whole buckets are evicted as time moves on,
+    so the memory used doesn't depend on the message rate. The window covers between
+    `seconds - seconds / buckets` and `seconds` of samples.
+    """
+
+    def __init__(self, seconds, buckets=60):
+        self.seconds = seconds
+        self.width = seconds / buckets
+        self.sums = array('d', bytes(8 * buckets))
+        self.stamps = array('q', [-1] * buckets)  # Bucket number held in each slot, -1 when empty
+        self.last_bucket = None
+        self.total = 0.0
+
+    def push(self, timestamp, value):
+        self.expire(timestamp)
+        bucket = int(timestamp // self.width)
+        if bucket <= self.last_bucket - len(self.sums):
+            return  # Older than the window
+        slot = bucket % len(self.sums)
+        if self.stamps[slot] != bucket:
+            self.stamps[slot] = bucket
+            self.sums[slot] = 0.0
+        self.sums[slot] += value
+        self.total += value
+
+    def expire(self, now):
+        bucket = int(now // self.width)
+        if self.last_bucket is not None and bucket <= self.last_bucket:
+            return
+        self.last_bucket = bucket
+
+        oldest = bucket - len(self.sums)  # Buckets at or before this have left the window
+        evicted = False
+        for slot, stamp in enumerate(self.stamps):
+            if stamp != -1 and stamp <= oldest:
+                self.stamps[slot] = -1
+                self.sums[slot] = 0.0
+                evicted = True
+        if evicted:
+            # Summed again rather than subtracted so float error doesn't build up
+            self.total = sum(self.sums)
+
+    def nbytes(self):
+        return sys.getsizeof(self.sums) + sys.getsizeof(self.stamps)
+
+
+class MetricHistory:
+    """Fixed size ring buffer of metric samples, stored as one float64 array per metric."""
+
+    def __init__(self, names, length):
+        self.names = ['timestamp'] + list(names)
+        self.length = length
+        self.columns = [array('d', bytes(8 * length)) for _ in self.names]
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, metrics):
+        for name, column in zip(self.names, self.columns):
+            column[self.position] = metrics[name]
+        self.position = (self.position + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+
+    # Samples from oldest to newest as dicts of metric -> value
+    def get_records(self):
+        start = (self.position - self.count) % self.length
+        indexes = [(start + offset) % self.length for offset in range(self.count)]
+        return [{name: column[index] for name, column in zip(self.names, self.columns)} for index in indexes]
+
+    def nbytes(self):
+        return sum(sys.getsizeof(column) for column in self.columns)
+
+
+class BookAnalytics:
+    """
+    Microstructure metrics for a single L2 book, maintained incrementally.
+
+    The order book (BID/ASK sorted price -> size mappings) is owned by the OrderBook, this object
+    only keeps running sums next to it. `update_level` is called for every changed price level and
+    `refresh` once per message, so the work done is proportional to the levels that changed rather
+    than to the depth of the book.
+    """
+
+    def __init__(self, top_n=10, band_bps=10, windows=DEFAULT_WINDOWS, sample_interval=0.5,
+                 history_length=1200):
+        self.top_n = top_n
+        self.band_bps = band_bps
+        self.windows = windows
+        self.sample_interval = sample_interval
+
+        self.book = None
+
+        # Running sums - size of the best `top_n` levels and size within +/- band_bps of mid
+        self.top_sum = {BID: 0.0, ASK: 0.0}
+        self.band_sum = {BID: 0.0, ASK: 0.0}
+        self.band_edge = {BID: None, ASK: None}
+
+        # Top of book
+        self.best_bid = 0.0
+        self.best_ask = 0.0
+        self.mid = 0.0
+        self.spread = 0.0
+        self.weighted_mid = 0.0
+        self.bid_slope = 0.0
+        self.ask_slope = 0.0
+        self.last_mid = None
+
+        # Rolling windows keyed by their length in seconds
+        self.flow_net = {window: RollingWindow(window) for window in windows}
+        self.flow_gross = {window: RollingWindow(window) for window in windows}
+        self.variance = {window: RollingWindow(window) for window in windows}
+
+        # Sampled metrics for charting
+        self.history = MetricHistory(metric_names(windows), history_length)
+        self.last_sample = 0.0
+
+    # Number of levels on a side which are strictly better than price
+    def _rank(self, side, price):
+        levels = self.book[side]
+        if side == BID:
+            return len(levels) - levels.bisect_right(price)
+        return levels.bisect_left(price)
+
+    # Returns the (price, size) of the nth best level, 0 being the top of book
+    def _nth_level(self, side, n):
+        levels = self.book[side]
+        if side == BID:
+            return levels.peekitem(len(levels) - 1 - n)
+        return levels.peekitem(n)
+
+    def _in_band(self, side, price):
+        edge = self.band_edge[side]
+        if edge is None:
+            return False
+        if side == BID:
+            return price >= edge
+        return price <= edge
+
+    def _range_sum(self, side, start, stop):
+        levels = self.book[side]
+        total = 0.0
+        for index in range(start, stop):
+            total += float(levels.peekitem(index)[1])
+        return total
+
+    # Called with the first book (and any later snapshot), this is the only full scan of the book
+    def reset(self, book, timestamp):
+        self.book = book
+        for side in (BID, ASK):
+            depth = min(self.top_n, len(book[side]))
+            self.top_sum[side] = sum(float(self._nth_level(side, n)[1]) for n in range(depth))
+            self.band_sum[side] = 0.0
+            self.band_edge[side] = None
+        self.refresh(timestamp)
+
+    # Must be called after the level has been changed in the book
+    def update_level(self, side, price, old_size, new_size):
+        price = float(price)
+        old_size = float(old_size)
+        new_size = float(new_size)
+        levels = self.book[side]
+        rank = self._rank(side, price)
+
+        if rank < self.top_n:
+            if old_size and new_size:  # Size changed in place
+                self.top_sum[side] += new_size - old_size
+            elif new_size:  # New level pushes the nth level out of the top
+                self.top_sum[side] += new_size
+                if len(levels) > self.top_n:
+                    self.top_sum[side] -= float(self._nth_level(side, self.top_n)[1])
+            elif old_size:  # Removed level lets the next level into the top
+                self.top_sum[side] -= old_size
+                if len(levels) >= self.top_n:
+                    self.top_sum[side] += float(self._nth_level(side, self.top_n - 1)[1])
+
+        if self._in_band(side, price):
+            self.band_sum[side] += new_size - old_size
+
+    # Moves the depth band edge, only touching the levels between the old and the new edge
+    def _shift_band(self, side, edge):
+        levels = self.book[side]
+        old_edge = self.band_edge[side]
+        self.band_edge[side] = edge
+
+        if side == BID:  # Band is every bid >= edge
+            if old_edge is None:
+                self.band_sum[side] = self._range_sum(side, levels.bisect_left(edge), len(levels))
+            elif edge < old_edge:
+                self.band_sum[side] += self._range_sum(side, levels.bisect_left(edge), levels.bisect_left(old_edge))
+            elif edge > old_edge:
+                self.band_sum[side] -= self._range_sum(side, levels.bisect_left(old_edge), levels.bisect_left(edge))
+        else:  # Band is every ask <= edge
+            if old_edge is None:
+                self.band_sum[side] = self._range_sum(side, 0, levels.bisect_right(edge))
+            elif edge > old_edge:
+                self.band_sum[side] += self._range_sum(side, levels.bisect_right(old_edge), levels.bisect_right(edge))
+            elif edge < old_edge:
+                self.band_sum[side] -= self._range_sum(side, levels.bisect_right(edge), levels.bisect_right(old_edge))
+
+    # Size per unit of price across the top levels of a side
+    def _slope(self, side):
+        depth = min(self.top_n, len(self.book[side]))
+        distance = abs(float(self._nth_level(side, 0)[0]) - float(self._nth_level(side, depth - 1)[0]))
+        if distance == 0:
+            return self.top_sum[side]
+        return self.top_sum[side] / distance
+
+    # Called once per book message after all levels have been updated
+    def refresh(self, timestamp):
+        if not self.book or not self.book[BID] or not self.book[ASK]:
+            return
+
+        bid_price, bid_size = self._nth_level(BID, 0)
+        ask_price, ask_size = self._nth_level(ASK, 0)
+        bid_price, bid_size = float(bid_price), float(bid_size)
+        ask_price, ask_size = float(ask_price), float(ask_size)
+
+        self.best_bid = bid_price
+        self.best_ask = ask_price
+        self.spread = ask_price - bid_price
+        self.mid = (ask_price + bid_price) / 2
+        self.weighted_mid = (bid_price * ask_size + ask_price * bid_size) / (bid_size + ask_size)
+        self.bid_slope = self._slope(BID)
+        self.ask_slope = self._slope(ASK)
+
+        self._shift_band(BID, self.mid * (1 - self.band_bps / 10000))
+        self._shift_band(ASK, self.mid * (1 + self.band_bps / 10000))
+
+        if self.last_mid and self.mid != self.last_mid:
+            log_return = math.log(self.mid / self.last_mid)
+            for window in self.variance.values():
+                window.push(timestamp, log_return * log_return)
+        else:
+            for window in self.variance.values():
+                window.expire(timestamp)
+        self.last_mid = self.mid
+
+        for window in self.windows:
+            self.flow_net[window].expire(timestamp)
+            self.flow_gross[window].expire(timestamp)
+
+        self.sample(timestamp)
+
+    def add_trade(self, timestamp, side, amount, price):
+        value = float(price) * float(amount)
+        signed = value if side == 'buy' else -value
+        for window in self.windows:
+            self.flow_net[window].push(timestamp, signed)
+            self.flow_gross[window].push(timestamp, value)
+
+    def get_spread_bps(self):
+        if not self.mid:
+            return 0.0
+        return self.spread / self.mid * 10000
+
+    # (bid - ask) / (bid + ask) over the top_n levels, between -1 and 1
+    def get_imbalance(self):
+        total = self.top_sum[BID] + self.top_sum[ASK]
+        if total <= 0:
+            return 0.0
+        return (self.top_sum[BID] - self.top_sum[ASK]) / total
+
+    # Same form as the imbalance but using the depth slopes, positive means bids are steeper
+    def get_pressure(self):
+        total = self.bid_slope + self.ask_slope
+        if total <= 0:
+            return 0.0
+        return (self.bid_slope - self.ask_slope) / total
+
+    def get_trade_flow(self, window):
+        gross = self.flow_gross[window].total
+        if gross <= 0:
+            return 0.0
+        return self.flow_net[window].total / gross
+
+    # Realized volatility of the mid over the window, in bps
+    def get_volatility(self, window):
+        return math.sqrt(max(self.variance[window].total, 0.0)) * 10000
+
+    def get_metrics(self):
+        metrics = {
+            'mid': self.mid,
+            'spread': self.spread,
+            'spread_bps': self.get_spread_bps(),
+            'weighted_mid': self.weighted_mid,
+            'imbalance': self.get_imbalance(),
+            'pressure': self.get_pressure(),
+            'bid_depth': self.band_sum[BID],
+            'ask_depth': self.band_sum[ASK]
+        }
+        for window in self.windows:
+            metrics['trade_flow_' + str(window) + 's'] = self.get_trade_flow(window)
+            metrics['volatility_' + str(window) + 's'] = self.get_volatility(window)
+        return metrics
+
+    def sample(self, timestamp):
+        if timestamp - self.last_sample < self.sample_interval:
+            return
+        self.last_sample = timestamp
+        metrics = self.get_metrics()
+        metrics['timestamp'] = timestamp
+        self.history.append(metrics)
+
+    def get_history(self):
+        return self.history.get_records()
+
+    # Bytes held by the metric history and rolling windows, fixed for the life of the object
+    def nbytes(self):
+        windows = list(self.flow_net.values()) + list(self.flow_gross.values()) + list(self.variance.values())
+        return self.history.nbytes() + sum(window.nbytes() for window in windows)
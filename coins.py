@@ -1,91 +1,61 @@
+import threading
+
+from alerts import AlertEngine
 from cryptofeed_worker import OrderBook
+from memory_budget import MemoryBudget
+from symbol_registry import SymbolRegistry
 
 
 class MasterObject:
 
-    def __init__(self):
-        self.btcBookObject = OrderBook('btc',
-                                       'BTC-USD',
-                                       'BTC',
-                                       'BTC-USD Live Chart')
-
-        self.ethBookObject = OrderBook('eth',
-                                       'ETH-USD',
-                                       'ETH',
-                                       'ETH-USD Live Chart')
-
-        self.adaBookObject = OrderBook('ada',
-                                       'ADA-USD',
-                                       'ADA',
-                                       'ADA-USD Live Chart')
-
-        self.maticBookObject = OrderBook('matic',
-                                         'MATIC-USD',
-                                         'MATIC',
-                                         'MATIC-USD Live Chart')
-
-        self.batBookObject = OrderBook('bat',
-                                       'BAT-USD',
-                                       'BAT',
-                                       'BAT-USD Live Chart')
-
-        self.dotBookObject = OrderBook('dot',
-                                       'DOT-USD',
-                                       'DOT',
-                                       'DOT-USD Live Chart')
-
-        self.algoBookObject = OrderBook('algo',
-                                        'ALGO-USD',
-                                        'ALGO',
-                                        'ALGO-USD Live Chart')
-
-        self.uniBookObject = OrderBook('uni',
-                                       'UNI-USD',
-                                       'UNI',
-                                       'UNI-USD Live Chart')
-
-        self.solBookObject = OrderBook('sol',
-                                       'SOL-USD',
-                                       'SOL',
-                                       'SOL-USD Live Chart')
+    def __init__(self, registry=None):
+        # Coins come from the symbol registry, books are only created when first asked for
+        self.registry = registry or SymbolRegistry.load()
+        self.lock = threading.Lock()
 
-        self.chzBookObject = OrderBook('chz',
-                                       'CHZ-USD',
-                                       'CHZ',
-                                       'CHZ-USD Live Chart')
+        # One alert engine is shared by every book
+        self.alert_engine = AlertEngine()
 
-        self.manaBookObject = OrderBook('mana',
-                                        'MANA-USD',
-                                        'MANA',
-                                        'MANA-USD Live Chart')
+        # Only set when a memory budget is configured, otherwise books keep every level they're sent
+        self.budget = MemoryBudget.from_settings(self.registry.get_memory_settings())
 
-        self.etcBookObject = OrderBook('etc',
-                                       'ETC-USD',
-                                       'ETC',
-                                       'ETC-USD Live Chart')
+        self.dict_of_books = {}
 
-        self.tezosBookObject = OrderBook('xtz',
-                                         'XTZ-USD',
-                                         'XTZ',
-                                         'XTZ-USD Live Chart')
+    def get_registry(self):
+        return self.registry
 
-        self.dict_of_books = {
-            "btc": self.btcBookObject,
-            "eth": self.ethBookObject,
-            "ada": self.adaBookObject,
-            "matic": self.maticBookObject,
-            "bat": self.batBookObject,
-            "dot": self.dotBookObject,
-            "algo": self.algoBookObject,
-            "uni": self.uniBookObject,
-            "sol": self.solBookObject,
-            "chz": self.chzBookObject,
-            "mana": self.manaBookObject,
-            "etc": self.etcBookObject,
-            "xtz": self.tezosBookObject
-        }
+    def get_alert_engine(self):
+        return self.alert_engine
 
     def get_books(self, book):
         if book in self.dict_of_books:
             return self.dict_of_books.get(book)
 
+        config = self.registry.get(book)
+        if config is None:
+            return None
+
+        with self.lock:
+            if book not in self.dict_of_books:
+                self.dict_of_books[book] = OrderBook(config.name,
+                                                     config.symbol,
+                                                     config.size,
+                                                     config.sub_title,
+                                                     logo=config.logo,
+                                                     alert_engine=self.alert_engine,
+                                                     budget=self.budget)
+        return self.dict_of_books.get(book)
+
+    # Every book in the registry, used to build the feeds
+    def get_all_books(self):
+        return [self.get_books(name) for name in self.registry.get_names()]
+
+    def get_budget(self):
+        return self.budget
+
+    # Memory used by each book which has been created, plus the budget when there is one
+    def get_memory_report(self):
+        books = [book.get_memory_usage() for book in list(self.dict_of_books.values())]
+        return {'books': books,
+                'total_bytes': sum(book['total_bytes'] for book in books),
+                'budget': self.budget.get_report() if self.budget else None}
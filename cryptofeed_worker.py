@@ -1,26 +1,38 @@
 import asyncio
-from copy import deepcopy
+import base64
+import os
+import sys
+import time
+from array import array
+from collections import deque
 from datetime import datetime
 from decimal import Decimal
 
-import pandas
-from cryptofeed import FeedHandler
-from cryptofeed.callback import BookCallback, TradeCallback, BookUpdateCallback
-from cryptofeed.defines import L2_BOOK, BOOK_DELTA, TRADES, BID, ASK
-from CB_candle_worker import CandleWorker
+from array_book import from_cryptofeed
+from book_analytics import BookAnalytics, BID, ASK
 
-# Default lists (with a dictionary inside) to avoid errors on run
-from cryptofeed.exchanges import Coinbase
+# pandas, cryptofeed and the candle worker are imported where they are first used so that
+# importing this module (and starting the web server) stays fast
+
+
+# Set these to point the feed at another Coinbase compatible server, e.g. exchange_simulator.py
+FEED_ADDRESS = os.environ.get('COINBASE_WS')
+REST_API = os.environ.get('COINBASE_REST')
 
-bids = [({"side": "bid",
-          "ETH-USD Price": Decimal('3000'),
-          "size": "0.01"})]
 
-asks = [({"side": "ask",
-          "ETH-USD Price": Decimal('3100'),
-          "size": "0.01"})]
+# Default lists (with a dictionary inside) to avoid errors on run
+def default_side(side, symbol_string, price):
+    return [({"side": side,
+              symbol_string: Decimal(price),
+              "size": "0.01"})]
+
 
-handler = FeedHandler()
+# Packs floats into a base64 string of little-endian float64s, read as a Float64Array in the browser
+def pack_floats(values):
+    packed = array('d', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
 
 
 class TimeKeeper:
@@ -39,22 +51,31 @@ class TimeKeeper:
 # Credit to Bryant Moscon (http://www.bryantmoscon.com/)
 
 class OrderBook(object):
-    def __init__(self, name, symbol, size, sub_title):
+    # Slotted to keep the per symbol overhead down when running many pairs
+    __slots__ = ('name', 'symbol', 'symbol_string', 'size', 'sub_title', 'logo', 'book', 'trade_list',
+                 'version', 'payload', 'trade_version', 'num_buys', 'num_sells', 'value_buys', 'value_sells',
+                 'callbacks', 'candle_worker', 'rest_api', 'analytics', 'alert_engine', 'budget', 'max_levels',
+                 'messages')
+
+    def __init__(self, name, symbol, size, sub_title, logo=None, alert_engine=None, budget=None, rest_api=None):
         # Passed in params
         self.name = name
         self.symbol = symbol
         self.symbol_string = symbol + ' Price'
         self.size = size
         self.sub_title = sub_title
-        self.logo = '/assets/' + self.name + '.png'
+        self.logo = logo or '/assets/' + self.name + '.png'
 
         # Local object data attributes - not passed in
+        # The book is the only copy of the L2 data, DataFrames are built from it when a chart asks
         self.book = None
-        self.bids = pandas.DataFrame(data=bids)
-        self.asks = pandas.DataFrame(data=asks)
-        self.mid_market = 0.0
-        self.depth = 0
-        self.trade_list = []
+        self.trade_list = deque(maxlen=10)  # (side, amount, price)
+
+        # Bumped before and after every book change, so it's odd while the feed is changing the book
+        # Even versions are used to cache what is sent to the browser
+        self.version = 0
+        self.payload = None
+        self.trade_version = 0
 
         # session stats
         self.num_buys = 0
@@ -62,72 +83,183 @@ class OrderBook(object):
         self.value_buys = 0.0
         self.value_sells = 0.0
 
-        # This holds the callbacks for when cryptofeed returns data
-        self.L2 = {L2_BOOK: BookCallback(self.add_book),
-                   BOOK_DELTA: BookUpdateCallback(self.update_book),
-                   TRADES: TradeCallback(self.add_trade)}
+        # The feed callbacks and candle worker are created on first use
+        self.callbacks = None
+        self.candle_worker = None
+
+        # REST base url (without /products) for the candles, start_feed sets it to the feed's server
+        self.rest_api = rest_api or REST_API
+
+        # Levels kept per side, set by the memory budget when there is one
+        self.budget = budget
+        self.max_levels = None
+        self.messages = 0
+
+        # Microstructure metrics which are kept up to date alongside the book
+        self.analytics = BookAnalytics(history_length=budget.history_length) if budget else BookAnalytics()
+
+        # Shared alert engine, checked with the new metrics after every book update
+        self.alert_engine = alert_engine
+
+        if budget is not None:
+            budget.register(self)
 
-        # Specific candleworker
-        self.candle_worker = CandleWorker(self.symbol)
+    # This holds the callbacks for when cryptofeed returns data
+    @property
+    def L2(self):
+        if self.callbacks is None:
+            from cryptofeed.callback import BookCallback, TradeCallback, BookUpdateCallback
+            from cryptofeed.defines import L2_BOOK, BOOK_DELTA, TRADES
+
+            self.callbacks = {L2_BOOK: BookCallback(self.add_book),
+                              BOOK_DELTA: BookUpdateCallback(self.update_book),
+                              TRADES: TradeCallback(self.add_trade)}
+        return self.callbacks
+
+    @property
+    def mid_market(self):
+        return self.analytics.mid
 
     # Function to check if the current book matches the most recent message
+    # Only the levels we keep are compared as the book may be trimmed to max_levels
     def check_books(self, master):
         for side in (BID, ASK):
-            if len(master[side]) != len(self.book[side]):
+            keys = master[side].keys()
+            kept = len(self.book[side])
+            if len(keys) < kept:
                 return False  # Does not match
 
-            for price in master[side]:
+            best = keys[len(keys) - kept:] if side == BID else keys[:kept]
+            for price in best:
                 if price not in self.book[side]:
                     return False  # Does not match
 
-            for price in self.book[side]:
-                if price not in master[side]:
-                    return False  # Does not match
-
         return True  # Matches
 
     # Function which adds the initial book to the object
     # Only the book parameter is used however according to cryptofeed documentation
     # Best practice is to include the rest of the parameters
     async def add_book(self, feed, symbol, book, timestamp, receipt_timestamp):
-        if not self.book:  # First entry
-            self.book = deepcopy(book)
-            print('Book set!')
-
-            # Flatten book into list
-            self.flatten_book()
-        else:  # Checks if the message contains new data
-            assert (self.check_books(book))
+        if not self.book or not self.check_books(book):  # First entry or the book has moved on
+            self.version += 1
+            try:
+                self.book = from_cryptofeed(book)
+                print('Book set!')
+
+                self.analytics.reset(self.book, timestamp or receipt_timestamp)
+                self.trim_book()
+            finally:
+                self.version += 1
+        else:
             print('Books match!')
 
     # Updates the L2 book
     async def update_book(self, feed, symbol, update, timestamp, receipt_timestamp):
+        self.version += 1
+        try:
+            for side in (BID, ASK):
+                for price, size in update[side]:
+                    old_size = self.book[side].get(price, 0)
+                    if size == 0:  # Message indicates that the price level can be removed
+                        if not old_size:
+                            continue  # Already trimmed
+                        del self.book[side][price]
+                    else:  # Adjust price level
+                        self.book[side][price] = size
+                    self.analytics.update_level(side, price, old_size, size)
+            self.trim_book()
+            self.analytics.refresh(timestamp or receipt_timestamp)
+        finally:
+            self.version += 1
+
+        if self.alert_engine is not None and self.alert_engine.has_alerts(self.name):
+            self.alert_engine.observe_metrics(self.name, self.analytics.get_metrics(), timestamp or receipt_timestamp)
+
+        if self.budget is not None:
+            self.messages += 1
+            self.budget.maybe_rebalance(receipt_timestamp)
+
+    # Drops the levels furthest from the top of the book until each side fits in max_levels
+    # Never trims into the levels used for the top of book imbalance
+    def trim_book(self):
+        if self.max_levels is None:
+            return
+        max_levels = max(self.max_levels, self.analytics.top_n)
         for side in (BID, ASK):
-            for price, size in update[side]:
-                if size == 0:  # Message indicates that the price level can be removed
-                    del self.book[side][price]
-                else:  # Adjust price level
-                    self.book[side][price] = size
-        # Flatten book into list
-        self.flatten_book()
-
-    # Example taken from https://github.com/bmoscon/cryptofeed/blob/master/cryptofeed/backends/_util.py
-    # Used to flatten the order book to construct dataframe for usage in Dash
-    def flatten_book(self):
-        new_list = []
-        for side in (BID, ASK):
-            for price, data in self.book[side].items():
-                # This format allows for easy transference into a Pandas dataframe
-                # This was tested with 5000 entries and no noticeable performance issues were present
-                new_list.append({'side': side, self.symbol_string: price, 'size': data})
-
-        new_df = pandas.DataFrame(new_list)
-        self.bids = new_df.loc[new_df['side'] == 'bid']
-        self.asks = new_df.loc[new_df['side'] == 'ask']
-        self.mid_market = (float(self.asks.iloc[0][self.symbol_string]) + float(
-            self.bids.iloc[-1][self.symbol_string])) / 2
-
-    def add_trade(self, feed, symbol, order_id, timestamp, side, amount, price, receipt_timestamp):
+            for price, size in self.book[side].truncate(side, max_levels):
+                self.analytics.update_level(side, price, size, 0)
+
+    # Copies sides of the book as [(prices, sizes), ...] sorted by price, along with the book version
+    # The feed thread may change the book while this runs on the web server thread, so the copy is
+    # only used when the version was even (no change in progress) and the same before and after
+    def copy_levels(self, sides=(BID, ASK)):
+        while True:
+            version = self.version
+            if version % 2 == 0:
+                book = self.book
+                if book is None:
+                    return version, [([], []) for _ in sides]
+                levels = [(book[side].prices.tolist(), book[side].sizes.tolist()) for side in sides]
+                if version == self.version:
+                    return version, levels
+            time.sleep(0)  # Let the feed thread finish the update
+
+    def get_levels(self, side):
+        return self.copy_levels((side,))[1][0]
+
+    # Builds a DataFrame of one side for the server side charts
+    def get_side_frame(self, side, default_price):
+        import pandas
+
+        prices, sizes = self.get_levels(side)
+        if not prices:
+            return pandas.DataFrame(data=default_side(side, self.symbol_string, default_price))
+        return pandas.DataFrame({'side': side, self.symbol_string: prices, 'size': sizes})
+
+    # Bytes held by the analytics (metric history, rolling windows) and trades, which don't change
+    # with the depth of the book
+    def get_fixed_bytes(self):
+        return self.analytics.nbytes() + sum(sys.getsizeof(trade) for trade in self.trade_list)
+
+    def get_memory_usage(self):
+        book_bytes = self.book[BID].nbytes() + self.book[ASK].nbytes() if self.book else 0
+        fixed_bytes = self.get_fixed_bytes()
+        return {'name': self.name,
+                'symbol': self.symbol,
+                'bid_levels': len(self.book[BID]) if self.book else 0,
+                'ask_levels': len(self.book[ASK]) if self.book else 0,
+                'max_levels': self.max_levels,
+                'book_bytes': book_bytes,
+                'fixed_bytes': fixed_bytes,
+                'total_bytes': book_bytes + fixed_bytes}
+
+    # Compact version of the book for the clientside charts, built once per book version and
+    # shared by every viewer
+    def get_payload(self):
+        if self.book is None:
+            return None
+
+        payload = self.payload
+        if payload is not None and payload['version'] == self.version:
+            return payload
+
+        version, ((bid_prices, bid_sizes), (ask_prices, ask_sizes)) = self.copy_levels()
+        payload = {'key': self.name + ':' + str(version),
+                   'version': version,
+                   'symbol_string': self.symbol_string,
+                   'size': self.size,
+                   'logo': self.logo,
+                   'mid': self.analytics.mid,
+                   'bid_prices': pack_floats(bid_prices),
+                   'bid_sizes': pack_floats(bid_sizes),
+                   'ask_prices': pack_floats(ask_prices),
+                   'ask_sizes': pack_floats(ask_sizes)}
+        self.payload = payload
+        return payload
+
+    # Async so cryptofeed runs it on the feed loop with the book updates rather than in an executor,
+    # the analytics are only ever touched from that one thread
+    async def add_trade(self, feed, symbol, order_id, timestamp, side, amount, price, receipt_timestamp):
         if side == 'buy':
             self.num_buys += 1
             self.value_buys += (float(price) * float(amount))
@@ -135,25 +267,31 @@ class OrderBook(object):
             self.num_sells += 1
             self.value_sells += (float(price) * float(amount))
 
-        if len(self.trade_list) >= 10:
-            self.trade_list.pop(0)
-            self.trade_list.append(({'Currency Pair': symbol, 'Side': side, 'Amount': amount, 'Price': price}))
-        else:
-            self.trade_list.append(({'Currency Pair': symbol, 'Side': side, 'Amount': amount, 'Price': price}))
+        self.analytics.add_trade(timestamp or receipt_timestamp, side, amount, price)
+
+        self.trade_list.append((side, float(amount), float(price)))
+        self.trade_version += 1
 
     def get_name(self):
         return self.name
 
+    # Latest trades in the format used by the trade table
+    def get_trade_records(self):
+        return [{'Currency Pair': self.symbol, 'Side': side, 'Amount': amount, 'Price': price}
+                for side, amount, price in list(self.trade_list)]
+
     def get_trades(self):
-        return pandas.DataFrame(self.trade_list)
+        import pandas
+
+        return pandas.DataFrame(self.get_trade_records())
 
     # Return asks DF
     def get_asks(self):
-        return self.asks
+        return self.get_side_frame(ASK, '3100')
 
     # Return bids DF
     def get_bids(self):
-        return self.bids
+        return self.get_side_frame(BID, '3000')
 
     def get_symbol(self):
         return self.symbol
@@ -179,83 +317,83 @@ class OrderBook(object):
     def get_value_buys(self):
         return 'Value of buys: $' + '{:.2f}'.format(self.value_buys)
 
-    def get_candle_worker(self):
-        return self.candle_worker
-
-    def get_logo(self):
-        return self.logo
-
-
-def get_btc_feed():
-    return ['BTC-USD']
-
-
-def get_eth_feed():
-    return ['ETH-USD']
-
-
-def get_ada_feed():
-    return ['ADA-USD']
-
+    def get_analytics(self):
+        return self.analytics
 
-def get_matic_feed():
-    return ['MATIC-USD']
+    def get_spread(self):
+        return 'Spread: ' + '{:.2f}'.format(self.analytics.spread) + \
+               ' (' + '{:.2f}'.format(self.analytics.get_spread_bps()) + ' bps)'
 
+    def get_weighted_mid(self):
+        return 'Weighted mid: $' + '{:.2f}'.format(self.analytics.weighted_mid)
 
-def get_bat_feed():
-    return ['BAT-USD']
+    def get_imbalance(self):
+        return 'Top ' + str(self.analytics.top_n) + ' imbalance: ' + '{:+.2f}'.format(self.analytics.get_imbalance()) + \
+               ', pressure: ' + '{:+.2f}'.format(self.analytics.get_pressure())
 
+    def get_depth_band(self):
+        return 'Depth within ' + str(self.analytics.band_bps) + ' bps: ' + \
+               '{:.2f}'.format(self.analytics.band_sum[BID]) + ' bid / ' + \
+               '{:.2f}'.format(self.analytics.band_sum[ASK]) + ' ask'
 
-def get_dot_feed():
-    return ['DOT-USD']
+    def get_trade_flow(self):
+        return 'Trade flow imbalance: ' + ', '.join(
+            '{:+.2f}'.format(self.analytics.get_trade_flow(window)) + ' (' + str(window) + 's)'
+            for window in self.analytics.windows)
 
+    def get_volatility(self):
+        return 'Realized volatility: ' + ', '.join(
+            '{:.1f}'.format(self.analytics.get_volatility(window)) + ' bps (' + str(window) + 's)'
+            for window in self.analytics.windows)
 
-def get_algo_feed():
-    return ['ALGO-USD']
-
-
-def get_uni_feed():
-    return ['UNI-USD']
-
-
-def get_sol_feed():
-    return ['SOL-USD']
-
-
-def get_chz_feed():
-    return ['CHZ-USD']
+    # Specific candleworker
+    def get_candle_worker(self):
+        if self.candle_worker is None:
+            from CB_candle_worker import CandleWorker
 
+            api = self.rest_api + '/products' if self.rest_api else None
+            self.candle_worker = CandleWorker(self.symbol, api=api)
+        return self.candle_worker
 
-def get_mana_feed():
-    return ['MANA-USD']
+    def get_logo(self):
+        return self.logo
 
 
-def get_xtz_feed():
-    return ['XTZ-USD']
+# address is the WebSocket feed and rest_api the REST base url (without /products), both default
+# to the real Coinbase endpoints. ssl_context is used for the WebSocket when given, e.g. to trust the
+# simulator's self signed certificate
+def start_feed(books, address=None, rest_api=None, max_depth=500, ssl_context=None):
+    from cryptofeed import FeedHandler
+    from cryptofeed.defines import L2_BOOK, TRADES
+    from cryptofeed.exchanges import Coinbase
 
+    address = address or FEED_ADDRESS
+    rest_api = rest_api or REST_API
 
-def get_etc_feed():
-    return ['ETC-USD']
+    # Coinbase loads its symbol list from the REST API when the feed is created
+    if rest_api and hasattr(Coinbase, 'symbol_endpoint'):
+        Coinbase.symbol_endpoint = rest_api + '/products'
 
+    # The handler is created before the loop as it may switch the event loop policy to uvloop
+    handler = FeedHandler()
 
-def start_feed(btc_book, eth_book, ada_book, matic_book, bat_book, dot_book, algo_book, uni_book,
-               sol_book, chz_book, mana_book, etc_book, xtz_book):
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_btc_feed(), channels=[L2_BOOK, TRADES], callbacks=btc_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_eth_feed(), channels=[L2_BOOK, TRADES], callbacks=eth_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_ada_feed(), channels=[L2_BOOK, TRADES], callbacks=ada_book.L2))
-    handler.add_feed(
-        Coinbase(max_depth=500, symbols=get_matic_feed(), channels=[L2_BOOK, TRADES], callbacks=matic_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_bat_feed(), channels=[L2_BOOK, TRADES], callbacks=bat_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_dot_feed(), channels=[L2_BOOK, TRADES], callbacks=dot_book.L2))
-    handler.add_feed(
-        Coinbase(max_depth=500, symbols=get_algo_feed(), channels=[L2_BOOK, TRADES], callbacks=algo_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_uni_feed(), channels=[L2_BOOK, TRADES], callbacks=uni_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_sol_feed(), channels=[L2_BOOK, TRADES], callbacks=sol_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_chz_feed(), channels=[L2_BOOK, TRADES], callbacks=chz_book.L2))
-    handler.add_feed(
-        Coinbase(max_depth=500, symbols=get_mana_feed(), channels=[L2_BOOK, TRADES], callbacks=mana_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_xtz_feed(), channels=[L2_BOOK, TRADES], callbacks=xtz_book.L2))
-    handler.add_feed(Coinbase(max_depth=500, symbols=get_etc_feed(), channels=[L2_BOOK, TRADES], callbacks=etc_book.L2))
+
+    # One feed per book so each book only receives its own symbol
+    for book in books:
+        if rest_api:
+            book.rest_api = rest_api  # Candles come from the same server as the feed
+        depth = max_depth
+        if book.budget is not None:
+            # Subscribe at the book's share of the budget rather than the cap, so cryptofeed's copy of
+            # the levels it delivers stays small too. Never below the levels the top of book metrics use
+            depth = max(min(max_depth, book.max_levels), book.analytics.top_n)
+        feed = Coinbase(max_depth=depth, symbols=[book.get_symbol()], channels=[L2_BOOK, TRADES],
+                        callbacks=book.L2)
+        if address:
+            feed.address = address
+        if ssl_context is not None:
+            feed.ws_defaults['ssl'] = ssl_context
+        handler.add_feed(feed)
     handler.run(install_signal_handlers=False)
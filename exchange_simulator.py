@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import random
+import ssl
+import time
+import uuid
+from datetime import datetime
+
+from aiohttp import web, WSMsgType
+
+'''
+Local stand in for the Coinbase Pro WebSocket feed and REST API, used for soak and scale testing.
+
+It speaks the parts of the protocol the dashboard uses:
+    - level2 snapshot / l2update messages and matches on the WebSocket feed (ws://host:port/)
+    - GET /products and GET /products/{id}/candles on the REST API (http://host:port/products)
+
+cryptofeed only connects to wss:// addresses, so start the simulator with --ssl-port, --certfile and
+--keyfile and point the feed at it with start_feed(books, address='wss://127.0.0.1:8766',
+rest_api='http://127.0.0.1:8765', ssl_context=...), the context trusting the certificate. The candle
+worker uses CandleWorker(symbol, api='http://127.0.0.1:8765/products'), or set the COINBASE_WS and
+COINBASE_REST environment variables. soak_test.py does all of this itself.
+'''
+
+
+# A volatility regime, the simulator cycles through its regimes in order
+class Regime:
+    def __init__(self, name, duration, volatility, rate_multiplier=1.0):
+        self.name = name
+        self.duration = duration  # Seconds
+        self.volatility = volatility  # bps per sqrt(second)
+        self.rate_multiplier = rate_multiplier
+
+    # name:duration:volatility[:rate_multiplier]
+    @classmethod
+    def parse(cls, text):
+        parts = text.split(':')
+        return cls(parts[0], float(parts[1]), float(parts[2]), float(parts[3]) if len(parts) > 3 else 1.0)
+
+
+DEFAULT_REGIMES = 'calm:300:2,normal:300:5,volatile:120:20:3'
+
+# Spread (in ticks) past which new quotes are placed inside it
+MAX_SPREAD_TICKS = 4
+
+
+def format_time(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class SimulatedMarket:
+    """
+    The L2 book and trades for a single product.
+
+    Prices are held as integer ticks and each side keeps a sorted list of its ticks so the far
+    levels can be trimmed or refilled back to `depth` without scanning the book.
+    """
+
+    def __init__(self, product_id, price, depth, seed=None):
+        self.product_id = product_id
+        self.depth = depth
+        self.random = random.Random(seed)
+
+        # Roughly 1 bps ticks, rounded to a power of ten like real quote increments
+        self.tick = 10 ** math.floor(math.log10(price * 0.0001))
+        self.decimals = max(0, -int(math.floor(math.log10(self.tick))))
+        self.mid = price / self.tick
+
+        self.sizes = {'buy': {}, 'sell': {}}
+        self.ticks = {'buy': [], 'sell': []}
+        self.sequence = 0
+        self.trade_id = 0
+
+        best_bid = math.floor(self.mid) - 1
+        for level in range(depth):
+            self._set('buy', best_bid - level, self._random_size())
+            self._set('sell', best_bid + 2 + level, self._random_size())
+
+    def _random_size(self):
+        return round(self.random.expovariate(1.0) * 10, 4) + 0.0001
+
+    def _set(self, side, tick, size):
+        if tick not in self.sizes[side]:
+            bisect.insort(self.ticks[side], tick)
+        self.sizes[side][tick] = size
+
+    def _remove(self, side, tick):
+        del self.sizes[side][tick]
+        del self.ticks[side][bisect.bisect_left(self.ticks[side], tick)]
+
+    def price(self, tick):
+        return '{:.{}f}'.format(tick * self.tick, self.decimals)
+
+    def size(self, size):
+        return '{:.4f}'.format(size)
+
+    # Tick `distance` ticks away from the mid on a side, always on the right side of it
+    def _quote_tick(self, side, distance):
+        if side == 'buy':
+            return math.ceil(self.mid) - 1 - distance
+        return math.floor(self.mid) + 1 + distance
+
+    def best_bid(self):
+        return self.ticks['buy'][-1]
+
+    def best_ask(self):
+        return self.ticks['sell'][0]
+
+    def snapshot(self):
+        return {'type': 'snapshot',
+                'product_id': self.product_id,
+                'bids': [[self.price(tick), self.size(self.sizes['buy'][tick])] for tick in reversed(self.ticks['buy'])],
+                'asks': [[self.price(tick), self.size(self.sizes['sell'][tick])] for tick in self.ticks['sell']]}
+
+    # Moves the mid and changes a few levels, returns the list of [side, price, size] changes
+    def step(self, volatility, dt):
+        changes = []
+        self.mid *= math.exp(self.random.gauss(0, volatility / 10000 * math.sqrt(dt)))
+
+        # Keep the spread around the new mid, removing levels on the wrong side of it
+        while self.ticks['sell'] and self.best_ask() <= self.mid:
+            tick = self.best_ask()
+            self._remove('sell', tick)
+            changes.append(['sell', tick, 0])
+        while self.ticks['buy'] and self.best_bid() >= self.mid:
+            tick = self.best_bid()
+            self._remove('buy', tick)
+            changes.append(['buy', tick, 0])
+        if not self.ticks['buy']:
+            tick = math.floor(self.mid)
+            self._set('buy', tick, self._random_size())
+            changes.append(['buy', tick, self.sizes['buy'][tick]])
+        if not self.ticks['sell']:
+            tick = math.floor(self.mid) + 1
+            self._set('sell', tick, self._random_size())
+            changes.append(['sell', tick, self.sizes['sell'][tick]])
+
+        # When the mid has run through the book, quote back into the spread either side of it
+        if self.best_ask() - self.best_bid() > MAX_SPREAD_TICKS:
+            for side in ('buy', 'sell'):
+                tick = self._quote_tick(side, int(self.random.expovariate(1.0)))
+                self._set(side, tick, self._random_size())
+                changes.append([side, tick, self.sizes[side][tick]])
+
+        # Most activity happens near the mid
+        for _ in range(self.random.randint(1, 3)):
+            side = self.random.choice(('buy', 'sell'))
+            tick = self._quote_tick(side, int(self.random.expovariate(0.2)))
+            if tick in self.sizes[side] and self.random.random() < 0.3 and len(self.ticks[side]) > 1:
+                self._remove(side, tick)
+                changes.append([side, tick, 0])
+            else:
+                self._set(side, tick, self._random_size())
+                changes.append([side, tick, self.sizes[side][tick]])
+
+        # Keep each side at depth, refilling the far end when levels have been taken off the top
+        for side in ('buy', 'sell'):
+            ticks = self.ticks[side]
+            while len(ticks) < self.depth:
+                tick = ticks[0] - 1 if side == 'buy' else ticks[-1] + 1
+                self._set(side, tick, self._random_size())
+                changes.append([side, tick, self.sizes[side][tick]])
+            while len(ticks) > self.depth:
+                tick = ticks[0] if side == 'buy' else ticks[-1]
+                self._remove(side, tick)
+                changes.append([side, tick, 0])
+
+        return changes
+
+    def l2update(self, changes, timestamp):
+        return {'type': 'l2update',
+                'product_id': self.product_id,
+                'changes': [[side, self.price(tick), self.size(size)] for side, tick, size in changes],
+                'time': format_time(timestamp)}
+
+    def match(self, timestamp):
+        side = self.random.choice(('buy', 'sell'))
+        tick = self.best_ask() if side == 'buy' else self.best_bid()
+        self.sequence += 1
+        self.trade_id += 1
+        return {'type': 'match',
+                'trade_id': self.trade_id,
+                'maker_order_id': str(uuid.uuid4()),
+                'taker_order_id': str(uuid.uuid4()),
+                'side': side,
+                'size': self.size(self._random_size() / 10),
+                'price': self.price(tick),
+                'product_id': self.product_id,
+                'sequence': self.sequence,
+                'time': format_time(timestamp)}
+
+    # Candles are synthesised backwards from the current mid, seeded by bucket so repeated
+    # requests for the same period return the same data
+    def candles(self, start, end, granularity):
+        last_bucket = int(end // granularity) * granularity
+        first_bucket = int(start // granularity) * granularity
+        volatility = 5 / 10000 * math.sqrt(granularity)
+        close = self.mid * self.tick
+        rows = []
+        for bucket in range(last_bucket, first_bucket - 1, -granularity):
+            rng = random.Random(hash((self.product_id, granularity, bucket)))
+            open_price = close * math.exp(rng.gauss(0, volatility))
+            high = max(open_price, close) * (1 + abs(rng.gauss(0, volatility / 2)))
+            low = min(open_price, close) * (1 - abs(rng.gauss(0, volatility / 2)))
+            rows.append([bucket, round(low, self.decimals), round(high, self.decimals),
+                         round(open_price, self.decimals), round(close, self.decimals),
+                         round(rng.expovariate(1.0) * 100, 4)])
+            close = open_price
+        return rows  # Newest first, like Coinbase
+
+
+class ExchangeSimulator:
+    def __init__(self, num_symbols=13, depth=500, rate=10.0, trade_ratio=0.1, regimes=DEFAULT_REGIMES, seed=0):
+        self.rate = rate  # Book updates per second per symbol
+        if trade_ratio < 0:
+            raise ValueError('trade_ratio must not be negative')
+        self.trade_ratio = trade_ratio  # Average trades per book update, can be above 1
+        self.regimes = [Regime.parse(text) for text in regimes.split(',')]
+        self.started = time.time()
+
+        rng = random.Random(seed)
+        self.markets = {}
+        for index in range(num_symbols):
+            product_id = 'SIM{:03d}-USD'.format(index)
+            self.markets[product_id] = SimulatedMarket(product_id, 10 ** rng.uniform(-1, 4.5), depth,
+                                                       seed=seed + index)
+
+        # WebSocket -> {channel: set of product ids}
+        self.subscribers = {}
+        self.messages_sent = 0
+
+    def current_regime(self):
+        elapsed = (time.time() - self.started) % sum(regime.duration for regime in self.regimes)
+        for regime in self.regimes:
+            if elapsed < regime.duration:
+                return regime
+            elapsed -= regime.duration
+        return self.regimes[-1]
+
+    async def products(self, request):
+        return web.json_response([{'id': product_id,
+                                   'base_currency': product_id.split('-')[0],
+                                   'quote_currency': product_id.split('-')[1],
+                                   'base_min_size': '0.0001',
+                                   'base_max_size': '1000000',
+                                   'quote_increment': market.price(1),
+                                   'base_increment': '0.0001',
+                                   'display_name': product_id.replace('-', '/'),
+                                   'status': 'online',
+                                   'trading_disabled': False}
+                                  for product_id, market in self.markets.items()])
+
+    async def candles(self, request):
+        market = self.markets.get(request.match_info['product_id'])
+        if market is None:
+            return web.json_response({'message': 'NotFound'}, status=404)
+
+        granularity = int(request.query.get('granularity', 60))
+        now = time.time()
+        end = datetime.fromisoformat(request.query['end']).timestamp() if 'end' in request.query else now
+        start = datetime.fromisoformat(request.query['start']).timestamp() if 'start' in request.query \
+            else end - granularity * 300
+        return web.json_response(market.candles(start, min(end, now), granularity))
+
+    async def feed(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.subscribers[ws] = {}
+
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                await self.subscribe(ws, json.loads(message.data))
+        finally:
+            del self.subscribers[ws]
+        return ws
+
+    async def subscribe(self, ws, message):
+        if message.get('type') != 'subscribe':
+            return
+
+        # Channels can be plain names using the top level product_ids or {'name': ..., 'product_ids': ...}
+        channels = self.subscribers[ws]
+        for channel in message.get('channels', []):
+            if isinstance(channel, dict):
+                name, product_ids = channel['name'], channel.get('product_ids', [])
+            else:
+                name, product_ids = channel, message.get('product_ids', [])
+            product_ids = [product_id for product_id in product_ids if product_id in self.markets]
+            channels.setdefault(name, set()).update(product_ids)
+
+            if name == 'level2':
+                for product_id in product_ids:
+                    await ws.send_str(json.dumps(self.markets[product_id].snapshot()))
+
+        await ws.send_str(json.dumps({'type': 'subscriptions',
+                                      'channels': [{'name': name, 'product_ids': sorted(product_ids)}
+                                                   for name, product_ids in channels.items()]}))
+
+    async def broadcast(self, channel, product_id, message):
+        text = None
+        for ws, channels in list(self.subscribers.items()):
+            if product_id in channels.get(channel, ()):
+                if text is None:
+                    text = json.dumps(message)
+                try:
+                    await ws.send_str(text)
+                    self.messages_sent += 1
+                except ConnectionError:
+                    pass
+
+    # Produces updates for every market, spreading them evenly over time
+    async def run_market(self, tick_interval=0.01):
+        pending = {product_id: 0.0 for product_id in self.markets}
+        last = time.time()
+        while True:
+            await asyncio.sleep(tick_interval)
+            now = time.time()
+            dt = now - last
+            last = now
+
+            regime = self.current_regime()
+            for product_id, market in self.markets.items():
+                pending[product_id] += self.rate * regime.rate_multiplier * dt
+                while pending[product_id] >= 1:
+                    pending[product_id] -= 1
+                    step_dt = 1 / (self.rate * regime.rate_multiplier)
+                    await self.broadcast('level2', product_id,
+                                         market.l2update(market.step(regime.volatility, step_dt), time.time()))
+                    # The whole part of the ratio is sent every update, the fraction some of the time
+                    trades = int(self.trade_ratio)
+                    if market.random.random() < self.trade_ratio - trades:
+                        trades += 1
+                    for _ in range(trades):
+                        await self.broadcast('matches', product_id, market.match(time.time()))
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print('{} regime={} clients={} messages_sent={}'.format(
+                datetime.utcnow().strftime('%H:%M:%S'), self.current_regime().name, len(self.subscribers),
+                self.messages_sent), flush=True)
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_get('/', self.feed)
+        app.router.add_get('/products', self.products)
+        app.router.add_get('/products/{product_id}/candles', self.candles)
+        return app
+
+
+# ssl_port serves the same app over TLS as well, cryptofeed only connects to wss:// addresses
+async def start_simulator(simulator, host='127.0.0.1', port=8765, report_interval=0, ssl_port=None,
+                          ssl_context=None):
+    runner = web.AppRunner(simulator.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if ssl_port:
+        await web.TCPSite(runner, host, ssl_port, ssl_context=ssl_context).start()
+
+    tasks = [asyncio.ensure_future(simulator.run_market())]
+    if report_interval:
+        tasks.append(asyncio.ensure_future(simulator.report(report_interval)))
+    return runner, tasks
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Local Coinbase compatible exchange simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--symbols', type=int, default=13, help='Number of simulated products')
+    parser.add_argument('--depth', type=int, default=500, help='Levels per side of each book')
+    parser.add_argument('--rate', type=float, default=10.0, help='Book updates per second per product')
+    parser.add_argument('--trade-ratio', type=float, default=0.1, help='Average trades per book update, e.g. 2.5')
+    parser.add_argument('--regimes', default=DEFAULT_REGIMES,
+                        help='Comma separated name:seconds:volatility_bps[:rate_multiplier] regimes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--report', type=float, default=10.0, help='Seconds between status lines, 0 for none')
+    parser.add_argument('--ssl-port', type=int, default=None, help='Also serve wss:// and https:// on this port')
+    parser.add_argument('--certfile', default=None, help='Certificate for --ssl-port')
+    parser.add_argument('--keyfile', default=None, help='Private key for --ssl-port')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    simulator = ExchangeSimulator(args.symbols, args.depth, args.rate, args.trade_ratio, args.regimes, args.seed)
+
+    ssl_context = None
+    if args.ssl_port:
+        if not args.certfile:
+            raise SystemExit('--ssl-port needs --certfile (and --keyfile unless the key is in the certificate)')
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(start_simulator(simulator, args.host, args.port, args.report, args.ssl_port, ssl_context))
+    print('Simulating {} products on ws://{}:{} and http://{}:{}/products'.format(
+        args.symbols, args.host, args.port, args.host, args.port), flush=True)
+    if args.ssl_port:
+        print('Also on wss://{}:{}'.format(args.host, args.ssl_port), flush=True)
+    loop.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+from book_analytics import BID, ASK
+
+'''
+HTTP export of the books, trades and candles the dashboard already maintains, so other services
+don't have to scrape the UI. Routes are added to the Dash Flask server:
+
+    /api/v1/symbols
+    /api/v1/memory
+    /api/v1/books/<symbols>?depth=50&format=json|arrow
+    /api/v1/trades/<symbols>?format=json|arrow
+    /api/v1/candles/<symbols>?granularity=60&format=json|arrow
+
+<symbols> is one or more registry names separated by commas, e.g. /api/v1/books/btc,eth
+Responses are columnar - JSON objects of equal length lists, or an Arrow IPC stream when pyarrow is
+installed. Each response is encoded once per version of the data behind it and shared by every
+requester until that data changes.
+'''
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+JSON_MIMETYPE = 'application/json'
+
+DEFAULT_DEPTH = 50
+MAX_DEPTH = 1000
+
+# Same mapping as the candle slider in the dashboard
+GRANULARITIES = (60, 300, 900, 3600, 21600, 86400)
+
+
+class ResponseCache:
+    """
+    Encoded responses keyed by what they were built from (including the data versions).
+
+    Requests for a key which is already being built wait for that build rather than encoding the
+    same response again. Least recently used entries are dropped past max_entries.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.building = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            key_lock = self.building.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+
+            try:
+                body, mimetype = build()
+                entry = ('"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"', body, mimetype)
+
+                with self.lock:
+                    self.entries[key] = entry
+                    self.misses += 1
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            finally:
+                with self.lock:
+                    self.building.pop(key, None)
+        return entry
+
+
+def encode(columns, fmt):
+    if fmt == 'arrow':
+        import pyarrow
+
+        table = pyarrow.table(columns)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_MIMETYPE
+
+    return json.dumps(columns, separators=(',', ':')).encode(), JSON_MIMETYPE
+
+
+# copies are the (version, levels) returned by OrderBook.copy_levels for each book
+def book_columns(books, copies, depth):
+    columns = {'symbol': [], 'side': [], 'level': [], 'price': [], 'size': []}
+    for book, (version, levels) in zip(books, copies):
+        for side, (prices, sizes) in zip((BID, ASK), levels):
+            if side == BID:  # Best bid is the highest price
+                prices, sizes = prices[::-1], sizes[::-1]
+            prices, sizes = prices[:depth], sizes[:depth]
+            columns['symbol'] += [book.get_symbol()] * len(prices)
+            columns['side'] += [side] * len(prices)
+            columns['level'] += list(range(len(prices)))
+            columns['price'] += prices
+            columns['size'] += sizes
+    return columns
+
+
+def trade_columns(books):
+    columns = {'symbol': [], 'side': [], 'amount': [], 'price': []}
+    for book in books:
+        for side, amount, price in list(book.trade_list):
+            columns['symbol'].append(book.get_symbol())
+            columns['side'].append(side)
+            columns['amount'].append(amount)
+            columns['price'].append(price)
+    return columns
+
+
+def candle_columns(books, frames):
+    import pandas
+
+    columns = {'symbol': [], 'time': [], 'open': [], 'high': [], 'low': [], 'close': [], 'volume': []}
+    for book, df in zip(books, frames):
+        columns['symbol'] += [book.get_symbol()] * len(df)
+        columns['time'] += [int(value.timestamp()) for value in pandas.to_datetime(df['date'])]
+        for name in ('open', 'high', 'low', 'close', 'volume'):
+            columns[name] += [float(value) for value in df[name]]
+    return columns
+
+
+def error(message, status):
+    return Response(json.dumps({'error': message}), status=status, mimetype=JSON_MIMETYPE)
+
+
+def register_export_routes(server, master, cache=None):
+    cache = cache or ResponseCache()
+
+    def get_books(symbols):
+        books = [master.get_books(name) for name in symbols.split(',')]
+        if None in books:
+            return None
+        return books
+
+    def get_format():
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'arrow'):
+            return None
+        if fmt == 'arrow':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                return None
+        return fmt
+
+    def respond(key, build):
+        etag, body, mimetype = cache.get(key, build)
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        return Response(body, mimetype=mimetype, headers={'ETag': etag})
+
+    @server.route('/api/v1/symbols')
+    def export_symbols():
+        registry = master.get_registry()
+        return Response(json.dumps([{'name': name, 'symbol': registry.get(name).symbol}
+                                    for name in registry.get_names()]), mimetype=JSON_MIMETYPE)
+
+    # Per symbol memory use, only covers the books which have been created
+    @server.route('/api/v1/memory')
+    def export_memory():
+        return Response(json.dumps(master.get_memory_report()), mimetype=JSON_MIMETYPE)
+
+    @server.route('/api/v1/books/<symbols>')
+    def export_books(symbols):
+        books = get_books(symbols)
+        if books is None:
+            return error('Unknown symbol in ' + symbols, 404)
+        fmt = get_format()
+        if fmt is None:
+            return error('Unsupported format, use json or arrow (arrow needs pyarrow installed)', 406)
+        depth = min(max(request.args.get('depth', DEFAULT_DEPTH, type=int), 1), MAX_DEPTH)
+
+        # Copied first so the key has the versions of the levels which are encoded
+        copies = [book.copy_levels((BID, ASK)) for book in books]
+        key = ('books', fmt, depth, tuple((book.get_name(), version) for book, (version, levels) in zip(books, copies)))
+        return respond(key, lambda: encode(book_columns(books, copies, depth), fmt))
+
+    @server.route('/api/v1/trades/<symbols>')
+    def export_trades(symbols):
+        books = get_books(symbols)
+        if books is None:
+            return error('Unknown symbol in ' + symbols, 404)
+        fmt = get_format()
+        if fmt is None:
+            return error('Unsupported format, use json or arrow (arrow needs pyarrow installed)', 406)
+
+        key = ('trades', fmt, tuple((book.get_name(), book.trade_version) for book in books))
+        return respond(key, lambda: encode(trade_columns(books), fmt))
+
+    @server.route('/api/v1/candles/<symbols>')
+    def export_candles(symbols):
+        from CB_candle_worker import CandleFetchError
+
+        books = get_books(symbols)
+        if books is None:
+            return error('Unknown symbol in ' + symbols, 404)
+        fmt = get_format()
+        if fmt is None:
+            return error('Unsupported format, use json or arrow (arrow needs pyarrow installed)', 406)
+        granularity = request.args.get('granularity', 60, type=int)
+        if granularity not in GRANULARITIES:
+            return error('Granularity must be one of ' + ', '.join(str(gran) for gran in GRANULARITIES), 400)
+
+        # Keyed on when each symbol's candles were fetched, stale ones are refetched inside the build
+        # so only one request per key goes back to Coinbase
+        workers = [book.get_candle_worker() for book in books]
+        key = ('candles', fmt, granularity,
+               tuple((book.get_name(), worker.get_fetch_time(granularity), worker.is_stale(granularity))
+                     for book, worker in zip(books, workers)))
+        try:
+            return respond(key, lambda: encode(candle_columns(books, [worker.get_data(granularity)
+                                                                      for worker in workers]), fmt))
+        except CandleFetchError as err:
+            return error(str(err), 502)
+
+    return cache
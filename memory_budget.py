@@ -0,0 +1,114 @@
+import os
+
+# Two float64 arrays (price and size) on each of the two sides
+LEVEL_BYTES = 2 * 2 * 8
+
+BUDGET_ENV = 'DASHBOARD_MEMORY_BUDGET_MB'
+
+
+class MemoryBudget:
+    """
+    Splits a global byte budget for book levels across every OrderBook by activity.
+
+    Each book reports its message count. Every `rebalance_interval` seconds the budget, less the
+    fixed cost of each book (metric history, rolling windows, trades), is shared out in proportion
+    to a smoothed message rate and turned into a per-book `max_levels` limit, kept between
+    min_levels and max_levels. Books trim their far levels down to the limit on their next update.
+
+    Only the dashboard's own copy of each book is covered. cryptofeed keeps its own book for every
+    symbol (as deep as the exchange sends it) plus a copy of the levels it delivers, neither of
+    which is counted. The feeds are subscribed at each book's share to keep the second small.
+    """
+
+    def __init__(self, budget_bytes, min_levels=20, max_levels=500, history_length=240,
+                 rebalance_interval=30, smoothing=0.5):
+        self.budget_bytes = budget_bytes
+        self.min_levels = min_levels
+        self.max_levels = max_levels
+        self.history_length = history_length
+        self.rebalance_interval = rebalance_interval
+        self.smoothing = smoothing
+
+        self.books = []
+        self.activity = {}
+        self.last_rebalance = None
+
+    # settings is the optional "memory" section of the symbol config
+    @classmethod
+    def from_settings(cls, settings):
+        settings = dict(settings or {})
+        budget_mb = settings.pop('budget_mb', None)
+        budget_mb = os.environ.get(BUDGET_ENV) or budget_mb
+        if not budget_mb:
+            return None
+        return cls(int(float(budget_mb) * 1024 * 1024), **settings)
+
+    def register(self, book):
+        self.books.append(book)
+        self.activity[book.get_name()] = 0.0
+
+        # Until there's any activity every book gets an even share
+        share = self.budget_bytes // len(self.books) // LEVEL_BYTES
+        for registered in self.books:
+            registered.max_levels = self.clamp(share)
+
+    def clamp(self, levels):
+        return int(min(max(levels, self.min_levels), self.max_levels))
+
+    # Called by the books on every update, only does anything once per interval
+    def maybe_rebalance(self, now):
+        if self.last_rebalance is None:
+            self.last_rebalance = now
+        elif now - self.last_rebalance >= self.rebalance_interval:
+            self.rebalance(now)
+
+    def rebalance(self, now):
+        elapsed = max(now - self.last_rebalance, 1e-9)
+        self.last_rebalance = now
+
+        fixed = 0
+        for book in self.books:
+            rate = book.messages / elapsed
+            book.messages = 0
+            name = book.get_name()
+            self.activity[name] = self.smoothing * rate + (1 - self.smoothing) * self.activity[name]
+            fixed += book.get_fixed_bytes()
+
+        available = max(self.budget_bytes - fixed, 0)
+        shares = self.split(available // LEVEL_BYTES, self.activity)
+        for book in self.books:
+            book.max_levels = self.clamp(shares[book.get_name()])
+
+    # Splits levels in proportion to weights (name -> weight), keeping each share between min_levels
+    # and max_levels. What a capped share can't use goes to the others, so the budget is used up
+    def split(self, levels, weights):
+        shares = {}
+        remaining = list(weights)
+        while remaining:
+            left = levels - sum(shares.values())
+            total = sum(weights[name] for name in remaining)
+            proposed = {name: left * weights[name] / total if total > 0 else left / len(remaining)
+                        for name in remaining}
+
+            # Settle the capped shares first, their surplus may lift the others above min_levels
+            capped = [name for name in remaining if proposed[name] >= self.max_levels]
+            if capped:
+                settled, level = capped, self.max_levels
+            else:
+                settled = [name for name in remaining if proposed[name] <= self.min_levels]
+                level = self.min_levels
+            if not settled:
+                shares.update(proposed)
+                break
+            for name in settled:
+                shares[name] = level
+            remaining = [name for name in remaining if name not in shares]
+        return shares
+
+    def get_report(self):
+        return {'budget_bytes': self.budget_bytes,
+                'used_bytes': sum(book.get_memory_usage()['total_bytes'] for book in self.books),
+                'min_levels': self.min_levels,
+                'max_levels': self.max_levels,
+                'rebalance_interval': self.rebalance_interval,
+                'excludes': 'books held by the feed library (cryptofeed)'}
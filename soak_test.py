@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from coins import MasterObject
+from cryptofeed_worker import OrderBook, start_feed
+from symbol_registry import SymbolRegistry
+
+'''
+Soak harness - runs the feed workers against exchange_simulator.py and reports ingestion lag,
+CPU use and memory growth at a fixed interval.
+
+    python soak_test.py --symbols 100 --rate 20 --duration 14400
+'''
+
+# Next to this file, so the harness can be started from any directory
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exchange_simulator.py')
+
+
+def rss_mb():
+    # Current resident set size from /proc, falling back to the peak where /proc isn't available
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Self signed certificate for the simulator's wss:// port, cryptofeed won't connect to ws://
+def make_certificate(directory):
+    certfile = os.path.join(directory, 'simulator.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', certfile, '-out', certfile], check=True, capture_output=True)
+    return certfile
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LagRecorder:
+    """Collects the delay between the simulator's timestamp and the book update being processed."""
+
+    def __init__(self):
+        self.lags = []
+        self.messages = 0
+
+    def record(self, timestamp):
+        if timestamp:
+            self.lags.append(time.time() - timestamp)
+        self.messages += 1
+
+    # Returns the lags since the last call and starts a new interval
+    def collect(self):
+        lags, self.lags = self.lags, []
+        messages, self.messages = self.messages, 0
+        return sorted(lags), messages
+
+
+class MeasuredOrderBook(OrderBook):
+    __slots__ = ('recorder',)
+
+    def __init__(self, recorder, *args, **kwargs):
+        self.recorder = recorder
+        super().__init__(*args, **kwargs)
+
+    async def update_book(self, feed, symbol, update, timestamp, receipt_timestamp):
+        await super().update_book(feed, symbol, update, timestamp, receipt_timestamp)
+        self.recorder.record(timestamp)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Soak test the feed workers against the exchange simulator')
+    parser.add_argument('--port', type=int, default=8765, help='REST port, the WebSocket uses the next port up')
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=10.0, help='Book updates per second per product')
+    parser.add_argument('--regimes', default=None, help='Passed through to the simulator')
+    parser.add_argument('--duration', type=float, default=3600, help='Seconds to run for')
+    parser.add_argument('--interval', type=float, default=60, help='Seconds between reports')
+    parser.add_argument('--candles', action='store_true', help='Also poll the candle endpoint every interval')
+    parser.add_argument('--budget-mb', type=float, default=None, help='Run the books with a memory budget')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    certificate_dir = tempfile.TemporaryDirectory()
+    certfile = make_certificate(certificate_dir.name)
+    ssl_port = args.port + 1
+
+    simulator_args = [sys.executable, SIMULATOR, '--port', str(args.port), '--ssl-port', str(ssl_port),
+                      '--certfile', certfile,
+                      '--symbols', str(args.symbols), '--depth', str(args.depth), '--rate', str(args.rate),
+                      '--report', '0']
+    if args.regimes:
+        simulator_args += ['--regimes', args.regimes]
+    simulator = subprocess.Popen(simulator_args)
+    time.sleep(2)
+
+    try:
+        registry = SymbolRegistry([{'name': 'sim{:03d}'.format(index), 'symbol': 'SIM{:03d}-USD'.format(index)}
+                                   for index in range(args.symbols)],
+                                  memory={'budget_mb': args.budget_mb} if args.budget_mb else None)
+        master = MasterObject(registry)
+
+        address = 'wss://127.0.0.1:' + str(ssl_port)
+        rest_api = 'http://127.0.0.1:' + str(args.port)
+        ssl_context = ssl.create_default_context(cafile=certfile)
+
+        recorder = LagRecorder()
+        books = []
+        for name in registry.get_names():
+            config = registry.get(name)
+            books.append(MeasuredOrderBook(recorder, config.name, config.symbol, config.size, config.sub_title,
+                                           alert_engine=master.get_alert_engine(), budget=master.get_budget(),
+                                           rest_api=rest_api))
+        master.dict_of_books.update((book.get_name(), book) for book in books)
+
+        feed = threading.Thread(target=start_feed, args=[books],
+                                kwargs={'address': address, 'rest_api': rest_api, 'max_depth': args.depth,
+                                        'ssl_context': ssl_context},
+                                daemon=True)
+        feed.start()
+
+        start = time.time()
+        start_rss = rss_mb()
+        last_wall, last_cpu = start, time.process_time()
+        print('time      msgs/s   lag_p50_ms  lag_p99_ms  lag_max_ms  cpu_%   rss_mb  rss_growth_mb_per_h', flush=True)
+
+        while time.time() - start < args.duration:
+            time.sleep(args.interval)
+
+            if args.candles:
+                books[int(time.time()) % len(books)].get_candle_worker().build_df(60)
+
+            now, cpu = time.time(), time.process_time()
+            lags, messages = recorder.collect()
+            rss = rss_mb()
+            hours = (now - start) / 3600
+            print('{}  {:7.0f}  {:10.1f}  {:10.1f}  {:10.1f}  {:5.1f}  {:7.1f}  {:19.1f}'.format(
+                datetime.utcnow().strftime('%H:%M:%S'),
+                messages / (now - last_wall),
+                percentile(lags, 0.5) * 1000,
+                percentile(lags, 0.99) * 1000,
+                (lags[-1] if lags else 0.0) * 1000,
+                (cpu - last_cpu) / (now - last_wall) * 100,
+                rss,
+                (rss - start_rss) / hours if hours else 0.0), flush=True)
+            last_wall, last_cpu = now, cpu
+
+        report = master.get_memory_report()
+        print('Finished after {:.1f}h, RSS {:.1f}MB -> {:.1f}MB, books hold {:.1f}MB'.format(
+            (time.time() - start) / 3600, start_rss, rss_mb(), report['total_bytes'] / 1024 / 1024))
+        print(json.dumps(report, indent=2))
+    finally:
+        simulator.terminate()
+        simulator.wait()
+        certificate_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
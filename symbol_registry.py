@@ -0,0 +1,65 @@
+import json
+import os
+
+# The symbols file can be swapped out without changing the code
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.json')
+CONFIG_ENV = 'DASHBOARD_SYMBOLS'
+
+
+class SymbolConfig:
+    def __init__(self, name, symbol, size=None, sub_title=None, logo=None):
+        self.name = name
+        self.symbol = symbol
+        self.size = size or symbol.split('-')[0]
+        self.sub_title = sub_title or symbol + ' Live Chart'
+        self.logo = logo or '/assets/' + name + '.png'
+
+
+class SymbolRegistry:
+    """
+    The list of coins shown by the dashboard, loaded from a JSON config.
+
+    Each entry needs a `name` (used as the key everywhere in the app) and a Coinbase `symbol`,
+    `size`, `sub_title` and `logo` are optional and derived from those when missing. The optional
+    `memory` section holds the MemoryBudget settings.
+    """
+
+    def __init__(self, entries, default=None, memory=None):
+        self.symbols = {}
+        for entry in entries:
+            config = SymbolConfig(**entry)
+            self.symbols[config.name] = config
+
+        if not self.symbols:
+            raise ValueError('Symbol registry is empty')
+
+        self.default = default if default in self.symbols else next(iter(self.symbols))
+        self.memory = memory or {}
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or os.environ.get(CONFIG_ENV) or DEFAULT_CONFIG
+        with open(path) as config_file:
+            config = json.load(config_file)
+        return cls(config['symbols'], config.get('default'), config.get('memory'))
+
+    def __contains__(self, name):
+        return name in self.symbols
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def get(self, name):
+        return self.symbols.get(name)
+
+    def get_names(self):
+        return list(self.symbols)
+
+    def get_default(self):
+        return self.default
+
+    def get_memory_settings(self):
+        return self.memory
+
+    def get_dropdown_options(self):
+        return [{'label': config.size, 'value': config.name} for config in self.symbols.values()]
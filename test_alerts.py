@@ -0,0 +1,115 @@
+import random
+
+from alerts import Alert, AlertEngine, ThresholdIndex, ABOVE, BELOW, CROSS
+
+
+# What a linear scan of every alert would fire for a move from old to new
+def expected_hits(alerts, old, new):
+    hits = []
+    for alert in alerts:
+        rising = old <= alert.threshold < new
+        falling = new < alert.threshold <= old
+        if (rising and alert.condition in (ABOVE, CROSS)) or (falling and alert.condition in (BELOW, CROSS)):
+            hits.append(alert.alert_id)
+    return sorted(hits)
+
+
+def test_first_value_fires_conditions_already_met():
+    index = ThresholdIndex()
+    above = Alert(1, 'btc', 'mid', ABOVE, 10)
+    below = Alert(2, 'btc', 'mid', BELOW, 30)
+    index.add(above)
+    index.add(below)
+    index.add(Alert(3, 'btc', 'mid', ABOVE, 25))
+    index.add(Alert(4, 'btc', 'mid', CROSS, 15))  # Needs a move to fire
+
+    assert index.update(20) == [above, below]
+
+
+def test_rising_and_falling():
+    index = ThresholdIndex()
+    above = Alert(1, 'btc', 'mid', ABOVE, 10)
+    below = Alert(2, 'btc', 'mid', BELOW, 10)
+    cross = Alert(3, 'btc', 'mid', CROSS, 10)
+    for alert in (above, below, cross):
+        index.add(alert)
+
+    index.update(5)
+    assert index.update(15) == [above, cross]
+    assert index.update(12) == []
+    assert index.update(10) == []
+    assert index.update(9) == [below, cross]
+
+
+def test_remove():
+    index = ThresholdIndex()
+    first = Alert(1, 'btc', 'mid', CROSS, 10)
+    second = Alert(2, 'btc', 'mid', CROSS, 10)
+    index.add(first)
+    index.add(second)
+    index.remove(first)
+
+    assert len(index) == 2  # One entry in each direction for the remaining cross alert
+    index.update(5)
+    assert index.update(15) == [second]
+
+
+def test_matches_linear_scan():
+    rng = random.Random(5)
+    index = ThresholdIndex()
+    alerts = [Alert(n, 'btc', 'mid', rng.choice((ABOVE, BELOW, CROSS)), rng.randint(0, 100)) for n in range(500)]
+    for alert in alerts:
+        index.add(alert)
+
+    old = 50.0
+    index.update(old)
+    for _ in range(2000):
+        new = rng.choice((float(rng.randint(0, 100)), rng.uniform(0, 100)))
+        hits = sorted(alert.alert_id for alert in index.update(new))
+        assert hits == expected_hits(alerts, old, new)
+        old = new
+
+
+def test_engine_drops_oldest_when_full():
+    engine = AlertEngine(max_queue=2)
+    engine.add_alert('btc', 'mid', ABOVE, 1)
+    engine.add_alert('btc', 'mid', ABOVE, 2)
+    engine.add_alert('btc', 'mid', ABOVE, 3)
+
+    engine.observe('btc', 'mid', 0, 0.0)
+    assert engine.observe('btc', 'mid', 5, 1.0) == 3
+    assert engine.dropped == 1
+    assert [event['threshold'] for event in engine.get_recent()] == [3.0, 2.0]
+
+
+def test_engine_fires_new_alert_already_met():
+    engine = AlertEngine()
+    engine.add_alert('eth', 'spread_bps', ABOVE, 1)
+    engine.observe('eth', 'spread_bps', 7, 0.0)
+    engine.get_recent()
+
+    engine.add_alert('eth', 'spread_bps', ABOVE, 5)
+    assert [event['threshold'] for event in engine.get_recent()][0] == 5.0
+    assert engine.get_num_alerts() == 0
+
+
+def test_engine_alerts_fire_once():
+    engine = AlertEngine()
+    engine.add_alert('btc', 'mid', CROSS, 10)
+
+    engine.observe('btc', 'mid', 9, 0.0)
+    assert engine.observe('btc', 'mid', 11, 1.0) == 1
+    assert engine.observe('btc', 'mid', 9, 2.0) == 0
+    assert engine.observe('btc', 'mid', 11, 3.0) == 0
+    assert engine.get_num_alerts() == 0
+
+
+def test_engine_remove_alert():
+    engine = AlertEngine()
+    kept = engine.add_alert('btc', 'mid', ABOVE, 10)
+    removed = engine.add_alert('btc', 'mid', ABOVE, 12)
+    engine.remove_alert(removed.alert_id)
+
+    assert engine.get_alerts() == [kept]
+    engine.observe('btc', 'mid', 0, 0.0)
+    assert engine.observe('btc', 'mid', 20, 1.0) == 1
@@ -0,0 +1,104 @@
+import random
+
+from array_book import ArrayBookSide
+from book_analytics import BookAnalytics, RollingWindow, BID, ASK
+
+
+# Recomputes the running sums from the whole book
+def expected_top_sum(book, side, top_n):
+    prices = sorted(book[side].prices, reverse=side == BID)[:top_n]
+    return sum(book[side][price] for price in prices)
+
+
+def expected_band_sum(book, side, edge):
+    if side == BID:
+        return sum(size for price, size in book[side].items() if price >= edge)
+    return sum(size for price, size in book[side].items() if price <= edge)
+
+
+def build_book(rng, levels=50):
+    return {BID: ArrayBookSide((100 - 0.01 * (n + 1), rng.uniform(0.1, 5)) for n in range(levels)),
+            ASK: ArrayBookSide((100 + 0.01 * (n + 1), rng.uniform(0.1, 5)) for n in range(levels))}
+
+
+def check_sums(analytics, book):
+    for side in (BID, ASK):
+        assert abs(analytics.top_sum[side] - expected_top_sum(book, side, analytics.top_n)) < 1e-6
+        assert abs(analytics.band_sum[side] - expected_band_sum(book, side, analytics.band_edge[side])) < 1e-6
+
+
+def test_reset_matches_full_scan():
+    book = build_book(random.Random(1))
+    analytics = BookAnalytics(top_n=10, band_bps=5)
+    analytics.reset(book, 1.0)
+
+    check_sums(analytics, book)
+    assert analytics.best_bid == 99.99
+    assert analytics.best_ask == 100.01
+    assert abs(analytics.mid - 100) < 1e-9
+
+
+def test_incremental_sums_match_full_scan():
+    rng = random.Random(2)
+    book = build_book(rng)
+    analytics = BookAnalytics(top_n=10, band_bps=5)
+    analytics.reset(book, 0.0)
+
+    for step in range(3000):
+        mid = analytics.mid
+        side = rng.choice((BID, ASK))
+        offset = 0.01 * rng.randint(1, 60)
+        price = round(mid - offset if side == BID else mid + offset, 2)
+        old_size = book[side].get(price, 0)
+
+        if old_size and rng.random() < 0.4 and len(book[side]) > 2:
+            del book[side][price]
+            analytics.update_level(side, price, old_size, 0)
+        else:
+            size = round(rng.uniform(0.1, 5), 4)
+            book[side][price] = size
+            analytics.update_level(side, price, old_size, size)
+
+        analytics.refresh(step * 0.1)
+        check_sums(analytics, book)
+
+
+def test_removing_top_level_pulls_next_level_in():
+    book = build_book(random.Random(3), levels=15)
+    analytics = BookAnalytics(top_n=10, band_bps=5)
+    analytics.reset(book, 0.0)
+
+    price, size = book[ASK].peekitem(0)
+    del book[ASK][price]
+    analytics.update_level(ASK, price, size, 0)
+    analytics.refresh(1.0)
+
+    check_sums(analytics, book)
+
+
+def test_trade_flow_window_expires():
+    book = build_book(random.Random(4))
+    analytics = BookAnalytics(windows=(60,))
+    analytics.reset(book, 0.0)
+
+    analytics.add_trade(0.0, 'buy', 1, 100)
+    analytics.add_trade(30.0, 'sell', 1, 100)
+    assert analytics.get_trade_flow(60) == 0.0
+
+    analytics.refresh(70.0)  # The buy has left the window
+    assert analytics.get_trade_flow(60) == -1.0
+
+
+def test_rolling_window_memory_is_fixed():
+    window = RollingWindow(60, buckets=60)
+    size = window.nbytes()
+
+    samples = []
+    for step in range(3000):  # 10 samples a second for 300s
+        timestamp = step * 0.1
+        window.push(timestamp, 1.0)
+        samples.append(timestamp)
+
+    assert window.nbytes() == size
+    # Every sample in the current and previous 59 one second buckets
+    assert window.total == sum(1.0 for timestamp in samples if timestamp >= 240)
@@ -0,0 +1,61 @@
+from memory_budget import MemoryBudget, LEVEL_BYTES
+
+
+class FakeBook:
+    def __init__(self, name, fixed_bytes=0):
+        self.name = name
+        self.fixed_bytes = fixed_bytes
+        self.messages = 0
+        self.max_levels = None
+
+    def get_name(self):
+        return self.name
+
+    def get_fixed_bytes(self):
+        return self.fixed_bytes
+
+
+def build_budget(budget_mb, num_books, fixed_bytes=0):
+    budget = MemoryBudget(budget_mb * 1024 * 1024)
+    books = [FakeBook('book' + str(n), fixed_bytes) for n in range(num_books)]
+    for book in books:
+        budget.register(book)
+    return budget, books
+
+
+def test_skewed_activity_uses_the_budget():
+    budget, books = build_budget(3, 200, fixed_bytes=5000)
+    budget.maybe_rebalance(0.0)
+    for n, book in enumerate(books):
+        book.messages = n + 1  # Linearly skewed activity
+    budget.rebalance(30.0)
+
+    levels = [book.max_levels for book in books]
+    available = budget.budget_bytes - 200 * 5000
+    assert max(levels) == budget.max_levels
+    assert min(levels) == budget.min_levels
+    assert levels == sorted(levels)
+    # Only rounding down each share is left unused
+    assert available - 200 * LEVEL_BYTES < sum(levels) * LEVEL_BYTES <= available
+
+
+def test_split_redistributes_capped_surplus():
+    budget = MemoryBudget(0, min_levels=10, max_levels=100)
+    shares = budget.split(300, {'hot': 100.0, 'warm': 1.0, 'cold': 1.0})
+
+    assert shares == {'hot': 100, 'warm': 100, 'cold': 100}
+
+
+def test_split_floors_at_min_levels():
+    budget = MemoryBudget(0, min_levels=10, max_levels=100)
+    shares = budget.split(100, {'hot': 98.0, 'warm': 1.0, 'cold': 1.0})
+
+    assert shares['warm'] == shares['cold'] == 10
+    assert shares['hot'] == 80
+
+
+def test_no_activity_splits_evenly():
+    budget = MemoryBudget(0, min_levels=10, max_levels=100)
+    shares = budget.split(150, {'a': 0.0, 'b': 0.0, 'c': 0.0})
+
+    assert shares == {'a': 50, 'b': 50, 'c': 50}
@@ -1,19 +1,23 @@
+import os
 import threading
 import time
+from datetime import datetime
 
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 import dash_table
-import pandas
-import plotly.express as px
-from dash.dependencies import Input, Output
-from cryptofeed_worker import OrderBook, start_feed, TimeKeeper
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
+from cryptofeed_worker import start_feed, TimeKeeper
 from coins import MasterObject
-from CB_candle_worker import CandleWorker
+from book_analytics import metric_names
+from alerts import ABOVE, BELOW, CROSS
+from export_api import register_export_routes
 import logging
-import plotly.graph_objects as go
+
+# pandas and plotly are imported inside the graph builders, they're only needed once a chart is requested
 
 # Stop DASH from printing every POST result which is often due to interval callbacks
 log = logging.getLogger('werkzeug')
@@ -25,19 +29,44 @@ master = MasterObject()
 
 timeKeeperObject = TimeKeeper()
 
+# Dropdown options and the default coin come from the symbol registry
+token_options = master.get_registry().get_dropdown_options()
+
+default_book = master.get_registry().get_default()
+
+# 'server' builds every figure in build_graph, 'client' only sends the book arrays for the depth and
+# wall charts and leaves the figure to assets/depth_chart.js
+render_mode = os.environ.get('DASHBOARD_RENDER', 'server')
+
+# Charts which can be drawn in the browser
+client_charts = (None, 'depth', 'wall')
+
+# Shown until the first interval callback replaces it with a real chart
+placeholder_figure = {
+    'data': [],
+    'layout': {
+        'title': 'Waiting for order book data...',
+        'plot_bgcolor': '#262626',
+        'paper_bgcolor': '#262626',
+        'font': {'color': 'white'}
+    }
+}
+
 
 # Function which holds the Dash web server and starts the web server
 def run_server():
     base_trade = [({'Currency Pair': 'BTC-USD', 'Side': 'bid', 'Amount': '100', 'Price': '3000'})]
 
-    base_df = pandas.DataFrame(base_trade)
-
     app = dash.Dash(__name__, update_title=None, external_stylesheets=[dbc.themes.SLATE])
+
+    # Book, trade and candle snapshots for other services
+    register_export_routes(app.server, master)
+
     app.layout = html.Div([
         html.Div(
             className='split left',
             children=[
-                html.Div(children=[html.H3('ETH-USD Live Depth Chart',
+                html.Div(children=[html.H3(master.get_registry().get(default_book).symbol + ' Live Depth Chart',
                                            id='header')]),
 
                 html.Div(
@@ -47,21 +76,7 @@ def run_server():
                         dcc.Dropdown(
                             id='token-selector',
                             placeholder='Token',
-                            options=[
-                                {'label': 'BTC', 'value': 'btc'},
-                                {'label': 'ETH', 'value': 'eth'},
-                                {'label': 'ADA', 'value': 'ada'},
-                                {'label': 'MATIC', 'value': 'matic'},
-                                {'label': 'BAT', 'value': 'bat'},
-                                {'label': 'DOT', 'value': 'dot'},
-                                {'label': 'ALGO', 'value': 'algo'},
-                                {'label': 'UNI', 'value': 'uni'},
-                                {'label': 'SOL', 'value': 'sol'},
-                                {'label': 'CHZ', 'value': 'chz'},
-                                {'label': 'MANA', 'value': 'mana'},
-                                {'label': 'ETC', 'value': 'etc'},
-                                {'label': 'XTZ', 'value': 'xtz'}
-                            ]
+                            options=token_options
                         ),
                         dcc.Dropdown(
                             id='graph-selector',
@@ -69,25 +84,36 @@ def run_server():
                             options=[
                                 {'label': 'Depth chart', 'value': 'depth'},
                                 {'label': 'Wall chart', 'value': 'wall'},
-                                {'label': 'Daily Candlestick', 'value': 'candle'}
+                                {'label': 'Daily Candlestick', 'value': 'candle'},
+                                {'label': 'Spread', 'value': 'spread'},
+                                {'label': 'Order imbalance', 'value': 'imbalance'},
+                                {'label': 'Depth near mid', 'value': 'band'},
+                                {'label': 'Realized volatility', 'value': 'volatility'}
                             ]
+                        ),
+                        dcc.RadioItems(
+                            id='render-mode',
+                            options=[
+                                {'label': 'Server rendering', 'value': 'server'},
+                                {'label': 'Client rendering', 'value': 'client'}
+                            ],
+                            value=render_mode,
+                            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
                         )
                     ]
 
                 ),
                 html.Div([
                     dcc.Graph(id='live-update-graph',
-                              figure=px.ecdf(master.get_books("eth").get_asks(), x='ETH-USD Price', y="size",
-                                             ecdfnorm=None,
-                                             color="side",
-                                             labels={
-                                                 "size": "ETH",
-                                                 "side": "Side",
-                                                 "value": "ETH-USD Price"
-                                             },
-                                             title="ETH-USD Depth Chart using cryptofeed and Dash"),
+                              figure=placeholder_figure,
                               style={'width': '90%'}
                               ),
+                    dcc.Graph(id='client-graph',
+                              figure=placeholder_figure,
+                              style={'width': '90%', 'display': 'none'}
+                              ),
+                    dcc.Store(id='book-payload'),
+                    dcc.Store(id='book-version'),
                     html.Div(id='gran-slider',
                              children=[dcc.Slider(id='get-slider-value',
                                                   min=0,
@@ -109,8 +135,8 @@ def run_server():
                 html.Div([
                     dash_table.DataTable(
                         id='trade_table',
-                        columns=[{"name": i, "id": i} for i in base_df],
-                        data=base_df.to_dict('records'),
+                        columns=[{"name": i, "id": i} for i in base_trade[0]],
+                        data=base_trade,
                         style_cell={'textAlign': 'center', 'background-color': '#525252', 'text-color': 'white',
                                     'fontWeight': 'bold'},
                         style_table={'width': '95%'}
@@ -158,8 +184,73 @@ def run_server():
                         html.Output(
                             id='sellsValue',
                             children=['Value of sells:']
+                        ),
+                        html.Output(
+                            id='spreadBox',
+                            children=['Spread:']
+                        ),
+                        html.Output(
+                            id='weightedMidBox',
+                            children=['Weighted mid:']
+                        ),
+                        html.Output(
+                            id='imbalanceBox',
+                            children=['Imbalance:']
+                        ),
+                        html.Output(
+                            id='depthBox',
+                            children=['Depth near mid:']
+                        ),
+                        html.Output(
+                            id='flowBox',
+                            children=['Trade flow imbalance:']
+                        ),
+                        html.Output(
+                            id='volatilityBox',
+                            children=['Realized volatility:']
+                        )
+                    ]),
+                html.Div(
+                    className='stats',
+                    children=[
+                        html.H3('Alerts')
+                    ]),
+                html.Div(
+                    id='alert-inputs',
+                    children=[
+                        dcc.Dropdown(
+                            id='alert-symbol',
+                            placeholder='Token',
+                            options=token_options
+                        ),
+                        dcc.Dropdown(
+                            id='alert-metric',
+                            placeholder='Metric',
+                            options=[{'label': name, 'value': name} for name in metric_names()]
+                        ),
+                        dcc.Dropdown(
+                            id='alert-condition',
+                            placeholder='Condition',
+                            options=[
+                                {'label': 'Rises above', 'value': ABOVE},
+                                {'label': 'Falls below', 'value': BELOW},
+                                {'label': 'Crosses', 'value': CROSS}
+                            ]
+                        ),
+                        dcc.Input(id='alert-threshold', type='number', placeholder='Threshold'),
+                        html.Button('Add alert', id='alert-add', n_clicks=0),
+                        dcc.Dropdown(
+                            id='alert-registered',
+                            placeholder='Registered alerts',
+                            options=[]
+                        ),
+                        html.Button('Remove alert', id='alert-remove', n_clicks=0),
+                        html.Output(
+                            id='alert-status',
+                            children=['Alerts registered: 0']
                         )
-                    ])
+                    ]),
+                html.Ul(id='alert-list', children=[])
             ])
     ])
 
@@ -175,14 +266,48 @@ def run_server():
                    Output('buysBox', "children"),
                    Output('sellsBox', "children"),
                    Output('buysValue', "children"),
-                   Output('sellsValue', "children")],
+                   Output('sellsValue', "children"),
+                   Output('spreadBox', "children"),
+                   Output('weightedMidBox', "children"),
+                   Output('imbalanceBox', "children"),
+                   Output('depthBox', "children"),
+                   Output('flowBox', "children"),
+                   Output('volatilityBox', "children")],
                   [Input('stats-interval', 'n_intervals'),
                    Input('token-selector', 'value')])
     def update_stats(n, value):
         if value is not None:
             return get_book_stats_data(master.get_books(value))
         else:
-            return get_book_stats_data(master.get_books("eth"))
+            return get_book_stats_data(master.get_books(default_book))
+
+    # Adds and removes alerts, the registered list is also refreshed on the interval as alerts are
+    # removed once they fire
+    @app.callback([Output('alert-status', 'children'),
+                   Output('alert-registered', 'options')],
+                  [Input('alert-add', 'n_clicks'),
+                   Input('alert-remove', 'n_clicks'),
+                   Input('stats-interval', 'n_intervals')],
+                  [State('alert-symbol', 'value'),
+                   State('alert-metric', 'value'),
+                   State('alert-condition', 'value'),
+                   State('alert-threshold', 'value'),
+                   State('alert-registered', 'value')])
+    def update_registered_alerts(add_clicks, remove_clicks, n, symbol, metric, condition, threshold, alert_id):
+        engine = master.get_alert_engine()
+        triggered = [prop['prop_id'] for prop in dash.callback_context.triggered]
+        if 'alert-add.n_clicks' in triggered and None not in (symbol, metric, condition, threshold):
+            engine.add_alert(symbol, metric, condition, threshold)
+        if 'alert-remove.n_clicks' in triggered and alert_id is not None:
+            engine.remove_alert(alert_id)
+        options = [{'label': alert.describe(), 'value': alert.alert_id} for alert in engine.get_alerts()]
+        return 'Alerts registered: ' + str(engine.get_num_alerts()), options
+
+    @app.callback(Output('alert-list', 'children'),
+                  Input('stats-interval', 'n_intervals'))
+    def update_alerts(n):
+        return [html.Li(datetime.utcfromtimestamp(event['timestamp']).strftime('%H:%M:%S') + ' ' + event['message'])
+                for event in master.get_alert_engine().get_recent()]
 
     # Callback to update the graph with any updates to the L2 Book or candles
     @app.callback([Output('live-update-graph', 'figure'),
@@ -191,20 +316,59 @@ def run_server():
                   [Input('interval-component', 'n_intervals'),
                    Input('token-selector', 'value'),
                    Input('graph-selector', 'value'),
-                   Input('get-slider-value', 'value')])
-    def update_graph(n, value, g_value, s_value):
-        # Layout the graph
-        # BTC
-        if value is not None:
-            return build_graph(master.get_books(value), g_value, s_value)
-        else:
-            return build_graph(master.get_books("eth"), g_value, s_value)
+                   Input('get-slider-value', 'value'),
+                   Input('render-mode', 'value')])
+    def update_graph(n, value, g_value, s_value, mode):
+        order_book = master.get_books(value if value is not None else default_book)
+
+        # The browser draws these itself, only the header and trades are needed
+        if mode == 'client' and g_value in client_charts:
+            return dash.no_update, order_book.get_subtitle(), order_book.get_trade_records()
+
+        return build_graph(order_book, g_value, s_value)
+
+    @app.callback([Output('live-update-graph', 'style'),
+                   Output('client-graph', 'style')],
+                  [Input('graph-selector', 'value'),
+                   Input('render-mode', 'value')])
+    def update_graph_visibility(g_value, mode):
+        if mode == 'client' and g_value in client_charts:
+            return {'width': '90%', 'display': 'none'}, {'width': '90%'}
+        return {'width': '90%'}, {'width': '90%', 'display': 'none'}
+
+    # Sends the packed book to the browser, only when the client doesn't already have this version
+    @app.callback(Output('book-payload', 'data'),
+                  [Input('interval-component', 'n_intervals'),
+                   Input('token-selector', 'value'),
+                   Input('graph-selector', 'value'),
+                   Input('render-mode', 'value')],
+                  State('book-version', 'data'))
+    def update_payload(n, value, g_value, mode, version):
+        if mode != 'client' or g_value not in client_charts:
+            raise PreventUpdate
+
+        payload = master.get_books(value if value is not None else default_book).get_payload()
+        if payload is None or payload['key'] == version:
+            raise PreventUpdate
+        return payload
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='depth', function_name='render'),
+        [Output('client-graph', 'figure'),
+         Output('book-version', 'data')],
+        [Input('book-payload', 'data'),
+         Input('graph-selector', 'value')]
+    )
 
     # Run DASH server
     app.run_server()
 
 
 def build_graph(order_book, g_value, s_value):
+    import pandas
+    import plotly.express as px
+    import plotly.graph_objects as go
+
     if g_value == 'wall':
 
         frames = [order_book.get_asks(), order_book.get_bids()]
@@ -240,8 +404,10 @@ def build_graph(order_book, g_value, s_value):
             )
         )
 
-        new_df = pandas.DataFrame(order_book.trade_list)
-        return fig, order_book.get_subtitle(), new_df.to_dict('records')
+        return fig, order_book.get_subtitle(), order_book.get_trade_records()
+
+    elif g_value in metric_charts:
+        return build_metrics_graph(order_book, g_value)
 
     elif g_value == 'candle':
 
@@ -293,9 +459,7 @@ def build_graph(order_book, g_value, s_value):
             )
         )
 
-        new_df = pandas.DataFrame(order_book.trade_list)
-
-        return fig, order_book.get_subtitle(), new_df.to_dict('records')
+        return fig, order_book.get_subtitle(), order_book.get_trade_records()
 
     else:
         fig = px.ecdf(order_book.get_asks(), x=order_book.get_symbol_string(), y="size", ecdfnorm=None, color="side",
@@ -350,9 +514,55 @@ def build_graph(order_book, g_value, s_value):
             )
         )
 
-        new_df = pandas.DataFrame(order_book.trade_list)
+        return fig, order_book.get_subtitle(), order_book.get_trade_records()
+
+
+# Charts built from the sampled book analytics, chart type -> list of (metric, trace name)
+metric_charts = {
+    'spread': [('spread_bps', 'Spread (bps)')],
+    'imbalance': [('imbalance', 'Top of book imbalance'),
+                  ('pressure', 'Book pressure'),
+                  ('trade_flow_60s', 'Trade flow (60s)'),
+                  ('trade_flow_300s', 'Trade flow (300s)')],
+    'band': [('bid_depth', 'Bid depth'),
+             ('ask_depth', 'Ask depth')],
+    'volatility': [('volatility_60s', 'Realized volatility (60s, bps)'),
+                   ('volatility_300s', 'Realized volatility (300s, bps)')]
+}
+
+
+def build_metrics_graph(order_book, g_value):
+    import plotly.graph_objects as go
+
+    history = order_book.get_analytics().get_history()
+    times = [datetime.utcfromtimestamp(sample['timestamp']) for sample in history]
+
+    fig = go.Figure()
+    for metric, name in metric_charts.get(g_value):
+        fig.add_trace(go.Scatter(x=times, y=[sample.get(metric) for sample in history], mode='lines', name=name))
+
+    fig.update_layout(
+        plot_bgcolor='#262626',
+        paper_bgcolor='#262626',
+        font_color='white'
+    )
+
+    fig.add_layout_image(
+        dict(
+            source=order_book.get_logo(),
+            xref='paper',
+            yref='paper',
+            x=0.25,
+            y=1,
+            sizex=1,
+            sizey=1,
+            layer='below',
+            sizing='contain',
+            opacity=0.075
+        )
+    )
 
-        return fig, order_book.get_subtitle(), new_df.to_dict('records')
+    return fig, order_book.get_subtitle(), order_book.get_trade_records()
 
 
 def get_book_stats_data(orderbook):
@@ -360,7 +570,13 @@ def get_book_stats_data(orderbook):
            orderbook.get_num_buys(), \
            orderbook.get_num_sells(), \
            orderbook.get_value_buys(), \
-           orderbook.get_value_sells()
+           orderbook.get_value_sells(), \
+           orderbook.get_spread(), \
+           orderbook.get_weighted_mid(), \
+           orderbook.get_imbalance(), \
+           orderbook.get_depth_band(), \
+           orderbook.get_trade_flow(), \
+           orderbook.get_volatility()
 
 
 if __name__ == "__main__":
@@ -373,19 +589,8 @@ if __name__ == "__main__":
     # Cryptofeed thread takes the global carrier object as a parameter which is passed in as a callback
     # This object is then passed back and forth between cryptofeed and the webserver
 
-    t1 = threading.Thread(target=start_feed, args=[master.get_books("btc"),
-                                                   master.get_books('eth'),
-                                                   master.get_books('ada'),
-                                                   master.get_books('matic'),
-                                                   master.get_books('bat'),
-                                                   master.get_books('dot'),
-                                                   master.get_books('algo'),
-                                                   master.get_books('uni'),
-                                                   master.get_books('sol'),
-                                                   master.get_books('chz'),
-                                                   master.get_books('mana'),
-                                                   master.get_books('etc'),
-                                                   master.get_books('xtz')])
+    # The feeds (and the per book callbacks) are only built here, after the web server is up
+    t1 = threading.Thread(target=start_feed, args=[master.get_all_books()])
     t1.start()
     t2.join()
     t1.join()